@@ -0,0 +1,323 @@
+"""
+常驻的管理员权限助手进程
+界面进程（GUI 或命令行）保持普通权限，通过本地回环套接字把端口管理操作批量发送给助手执行，
+避免每次提权都重新启动整个程序。
+由前端监听、助手主动连回，每个助手只服务启动它的那一个前端
+"""
+import ctypes
+import hmac
+import json
+import os
+import secrets
+import socket
+import struct
+import sys
+import threading
+import time
+
+HEADER = struct.Struct("!I")
+MAX_MESSAGE = 16 << 20
+
+# 允许助手执行的操作
+PORT_MANAGER_OPERATIONS = (
+    "get_excluded_ports", "get_dynamic_port_range", "set_dynamic_port_range",
+    "add_port_exclusion", "delete_port_exclusion",
+    "get_hyperv_status", "set_hyperv", "get_wsl_status", "set_wsl",
+    "fix_common_ports",
+)
+
+
+class HelperError(Exception):
+    """助手调用失败"""
+
+
+class HelperDisconnected(HelperError):
+    """助手已退出或连接已断开"""
+
+
+def default_operations():
+    """助手可执行的操作表 {名称: 函数}"""
+    import port_manager
+    from snapshot_cache import collect_snapshot
+    from winnat_maintenance import reclaim_ports
+
+    operations = {name: getattr(port_manager, name) for name in PORT_MANAGER_OPERATIONS}
+    operations["reclaim_ports"] = reclaim_ports
+    operations["collect_snapshot"] = collect_snapshot
+    return operations
+
+
+def execute_batch(operations, calls):
+    """按顺序执行一批调用，返回 [{'ok': bool, 'value' 或 'error'}]"""
+    results = []
+    for call in calls:
+        name, args = call[0], call[1] if len(call) > 1 else []
+        func = operations.get(name)
+        if func is None:
+            results.append({'ok': False, 'error': f"不支持的操作: {name}"})
+            continue
+        try:
+            results.append({'ok': True, 'value': func(*args)})
+        except Exception as e:
+            results.append({'ok': False, 'error': str(e)})
+    return results
+
+
+def send_message(sock, obj):
+    """发送一条长度前缀的 JSON 消息"""
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_message(sock):
+    """接收一条消息，连接关闭时返回 None"""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE:
+        raise HelperError("消息过大")
+    data = _recv_exact(sock, size)
+    return None if data is None else json.loads(data)
+
+
+def serve_connection(sock, operations):
+    """
+    在已认证的连接上执行批量调用，直到对方断开或要求退出
+
+    助手中发生的修改操作随结果一起返回，由前端在自己的进程中通知监听者
+    """
+    import port_manager
+
+    mutations = []
+    port_manager.add_mutation_listener(mutations.append)
+    try:
+        while True:
+            request = recv_message(sock)
+            if request is None:
+                return
+            if request.get("shutdown"):
+                send_message(sock, {'ok': True})
+                return
+            results = execute_batch(operations, request.get("calls", []))
+            send_message(sock, {'ok': True, 'results': results, 'mutations': mutations[:]})
+            del mutations[:]
+    finally:
+        port_manager.remove_mutation_listener(mutations.append)
+
+
+def accept_helper(listener, token, timeout=60.0, handshake_timeout=5.0):
+    """
+    在前端的监听套接字上等待助手连接，返回第一个出示正确令牌的连接，超时返回 None
+
+    令牌错误或握手超时的连接直接关闭，不影响继续等待
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        listener.settimeout(remaining)
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            return None
+        conn.settimeout(handshake_timeout)
+        try:
+            hello = recv_message(conn)
+        except (OSError, ValueError, HelperError):
+            hello = None
+        if hello and hmac.compare_digest(str(hello.get("token", "")), token):
+            conn.settimeout(None)
+            send_message(conn, {'ok': True})
+            return conn
+        conn.close()
+
+
+class HelperClient:
+    """通过已认证的连接向助手发送批量调用"""
+
+    def __init__(self, sock, pid=None):
+        self._lock = threading.Lock()
+        self._sock = sock
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pid = pid
+
+    def call_batch(self, calls):
+        """一次往返执行多个调用，calls 为 [(名称, 参数列表)]，返回结果字典列表"""
+        import port_manager
+
+        with self._lock:
+            try:
+                send_message(self._sock, {"calls": [[name, list(args)] for name, args in calls]})
+                reply = recv_message(self._sock)
+            except OSError as e:
+                raise HelperDisconnected(f"管理员助手已断开: {e}") from e
+        if reply is None:
+            raise HelperDisconnected("管理员助手已断开")
+        # 在前端进程中转发助手里的修改通知，如让共享快照失效
+        for name in reply.get("mutations", ()):
+            port_manager.notify_mutation(name)
+        return reply["results"]
+
+    def call(self, name, *args):
+        """执行单个调用并返回结果，失败时抛出 HelperError"""
+        result = self.call_batch([(name, args)])[0]
+        if not result['ok']:
+            raise HelperError(result['error'])
+        return result['value']
+
+    def shutdown(self):
+        """通知助手退出"""
+        with self._lock:
+            send_message(self._sock, {"shutdown": True})
+            recv_message(self._sock)
+        self.close()
+
+    def close(self):
+        self._sock.close()
+
+
+class LocalOperations:
+    """在当前进程直接执行操作，与 HelperOperations 接口一致"""
+
+    def __init__(self, operations=None):
+        self._operations = operations if operations is not None else default_operations()
+
+    def __getattr__(self, name):
+        try:
+            return self._operations[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def batch(self, calls):
+        return execute_batch(self._operations, calls)
+
+    def close(self):
+        pass
+
+
+class HelperOperations:
+    """把属性访问转换为助手调用，如 ops.add_port_exclusion(3000, 3010)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args: self.client.call(name, *args)
+
+    def batch(self, calls):
+        return self.client.call_batch(calls)
+
+    def close(self):
+        """通知助手退出"""
+        try:
+            self.client.shutdown()
+        except OSError:
+            self.client.close()
+
+
+def run_helper(port, token, operations=None, timeout=30.0):
+    """
+    管理员助手进程入口：连接前端在 127.0.0.1:port 上的监听并出示令牌，只服务这一个连接
+
+    助手自身不监听端口，也不读写用户临时目录中的文件；前端已放弃等待时连接失败，助手直接退出
+    """
+    import port_manager
+
+    # 共享快照文件位于用户临时目录，由前端收到修改通知后自行失效
+    port_manager.set_shared_cache_invalidation(False)
+    try:
+        sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+        send_message(sock, {"token": token, "pid": os.getpid()})
+        reply = recv_message(sock)
+    except (OSError, ValueError, HelperError):
+        return False
+    if not reply or not reply.get("ok"):
+        sock.close()
+        return False
+
+    sock.settimeout(None)
+    try:
+        serve_connection(sock, operations if operations is not None else default_operations())
+    except (OSError, ValueError, HelperError):
+        pass
+    finally:
+        sock.close()
+    return True
+
+
+def helper_command():
+    """启动助手进程所用的程序和参数前缀"""
+    if getattr(sys, 'frozen', False):
+        return sys.executable, []
+    return sys.executable, [os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]
+
+
+def _listen_loopback():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+        # 防止其他进程抢占同一端口
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(4)
+    return listener
+
+
+def start_elevated_helper(timeout=60.0, extra_args=()):
+    """
+    通过 UAC 启动管理员助手并等待它连回，返回 (HelperClient 或 None, 错误信息)
+
+    前端监听回环端口，助手用命令行中的端口和令牌主动连接；
+    等待超时后监听关闭，之后才启动的助手连接失败并自行退出。
+    extra_args 追加到助手的命令行，如 ["--record", 轨迹文件]
+    """
+    token = secrets.token_hex(32)
+    listener = _listen_loopback()
+    try:
+        port = listener.getsockname()[1]
+        program, prefix = helper_command()
+        args = prefix + list(extra_args) + ["--helper", str(port), token]
+        params = " ".join(f'"{arg}"' for arg in args)
+        try:
+            ret = ctypes.windll.shell32.ShellExecuteW(None, "runas", program, params, None, 0)
+        except AttributeError:
+            return None, "当前系统不支持提权启动"
+        if ret <= 32:
+            return None, "已取消或无法获取管理员权限"
+
+        conn = accept_helper(listener, token, timeout)
+    finally:
+        # 只接受一个助手，之后不再监听
+        listener.close()
+    if conn is None:
+        return None, "等待管理员助手启动超时"
+    return HelperClient(conn), None
+
+
+def open_operations(extra_args=()):
+    """
+    获取端口管理操作的执行者：已是管理员时在本进程执行，否则启动管理员助手
+
+    返回 (LocalOperations 或 HelperOperations, 错误信息)
+    """
+    from port_manager import is_admin
+
+    if is_admin():
+        return LocalOperations(), None
+    client, err = start_elevated_helper(extra_args=extra_args)
+    if client is None:
+        return None, err
+    return HelperOperations(client), None
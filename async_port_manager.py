@@ -0,0 +1,241 @@
+"""
+port_manager 的 asyncio 版本
+与同步 API 共用同一份操作逻辑，命令通过 asyncio 子进程并发执行，支持并发上限、超时和取消
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+import weakref
+
+import port_manager
+from cmd_trace import RecordingBackend
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 60.0
+
+_concurrency = DEFAULT_CONCURRENCY
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_concurrency(limit):
+    """设置同时运行的命令数上限"""
+    global _concurrency
+    _concurrency = max(1, int(limit))
+    _semaphores.clear()
+
+
+def _semaphore():
+    # 信号量与事件循环绑定，每个循环各用一个
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = _semaphores[loop] = asyncio.Semaphore(_concurrency)
+    return sem
+
+
+async def _kill_tree(proc):
+    """
+    结束 shell 及其启动的全部子进程
+
+    proc.kill() 只会结束 cmd.exe / sh，卡住的 dism、netsh 仍会继续运行
+    """
+    if sys.platform == "win32":
+        killer = await asyncio.create_subprocess_exec(
+            "taskkill", "/F", "/T", "/PID", str(proc.pid),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        await killer.wait()
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    await proc.wait()
+
+
+async def _run_subprocess(cmd, timeout):
+    # 子进程单独成组（Windows 上为新的进程组），超时或取消时可以整组结束
+    if sys.platform == "win32":
+        group = {'creationflags': 0x00000200}  # CREATE_NEW_PROCESS_GROUP
+    else:
+        group = {'start_new_session': True}
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **group,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except BaseException:
+        # 超时或被取消时结束整个进程树，避免遗留
+        if proc.returncode is None:
+            await asyncio.shield(_kill_tree(proc))
+        raise
+    return stdout, stderr, proc.returncode
+
+
+async def run_cmd(cmd, timeout=DEFAULT_TIMEOUT):
+    """异步执行命令并返回 (stdout, stderr, returncode)，超时返回错误而不抛出"""
+    backend = port_manager.get_command_backend()
+    recorder = None
+    if isinstance(backend, RecordingBackend) and backend.inner is port_manager.subprocess_backend:
+        # 录制真实命令时仍走 asyncio 子进程，结果再交给录制器写入
+        recorder, backend = backend, backend.inner
+    async with _semaphore():
+        try:
+            if backend is port_manager.subprocess_backend:
+                start = time.perf_counter()
+                stdout, stderr, code = await _run_subprocess(cmd, timeout)
+                if recorder:
+                    recorder.record(cmd, stdout, stderr, code, start, time.perf_counter() - start)
+            else:
+                # 模拟器、录制回放等自定义后端在线程池中执行
+                loop = asyncio.get_running_loop()
+                stdout, stderr, code = await asyncio.wait_for(
+                    loop.run_in_executor(None, backend, cmd, True), timeout)
+        except asyncio.TimeoutError:
+            return "", f"命令超时 ({timeout} 秒): {cmd}", 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return "", str(e), 1
+    return port_manager.decode_output(stdout), port_manager.decode_output(stderr), code
+
+
+async def run_operation(func, *args, timeout=DEFAULT_TIMEOUT):
+    """异步驱动 port_manager 中用 command_operation 包装的操作"""
+    gen = func.operation(*args)
+    try:
+        cmd = next(gen)
+        while True:
+            cmd = gen.send(await run_cmd(cmd, timeout))
+    except StopIteration as e:
+        return e.value
+
+
+async def get_excluded_ports(timeout=DEFAULT_TIMEOUT):
+    """获取当前被预留的端口列表"""
+    return await run_operation(port_manager.get_excluded_ports, timeout=timeout)
+
+
+async def get_dynamic_port_range(timeout=DEFAULT_TIMEOUT):
+    """获取当前动态端口范围设置"""
+    return await run_operation(port_manager.get_dynamic_port_range, timeout=timeout)
+
+
+async def set_dynamic_port_range(start, count, timeout=DEFAULT_TIMEOUT):
+    """设置动态端口范围（需要重启生效）"""
+    return await run_operation(port_manager.set_dynamic_port_range, start, count, timeout=timeout)
+
+
+async def add_port_exclusion(start, end=None, timeout=DEFAULT_TIMEOUT):
+    """添加管理员端口排除（立即生效）"""
+    return await run_operation(port_manager.add_port_exclusion, start, end, timeout=timeout)
+
+
+async def delete_port_exclusion(start, end=None, timeout=DEFAULT_TIMEOUT):
+    """删除管理员端口排除"""
+    return await run_operation(port_manager.delete_port_exclusion, start, end, timeout=timeout)
+
+
+async def get_hyperv_status(timeout=DEFAULT_TIMEOUT):
+    """获取 Hyper-V 状态"""
+    return await run_operation(port_manager.get_hyperv_status, timeout=timeout)
+
+
+async def set_hyperv(enable, timeout=DEFAULT_TIMEOUT):
+    """开启或关闭 Hyper-V（需要重启）"""
+    return await run_operation(port_manager.set_hyperv, enable, timeout=timeout)
+
+
+async def get_wsl_status(timeout=DEFAULT_TIMEOUT):
+    """获取 WSL 状态"""
+    return await run_operation(port_manager.get_wsl_status, timeout=timeout)
+
+
+async def set_wsl(enable, timeout=DEFAULT_TIMEOUT):
+    """开启或关闭 WSL（需要重启）"""
+    return await run_operation(port_manager.set_wsl, enable, timeout=timeout)
+
+
+async def fix_common_ports(timeout=DEFAULT_TIMEOUT):
+    """一键修复常用开发端口（3000-10000）"""
+    return await set_dynamic_port_range(49152, 16384, timeout=timeout)
+
+
+async def gather_operations(*calls, timeout=DEFAULT_TIMEOUT):
+    """
+    并发执行多个操作，按传入顺序返回结果
+
+    calls 为 (函数, 参数...) 元组，函数是 port_manager 中的同步操作；
+    单个操作抛出的异常作为结果返回，不影响其他操作
+    """
+    return await asyncio.gather(
+        *(run_operation(call[0], *call[1:], timeout=timeout) for call in calls),
+        return_exceptions=True,
+    )
+
+
+async def collect_status(timeout=DEFAULT_TIMEOUT):
+    """并发收集端口排除、动态范围和 Hyper-V/WSL 状态，总耗时约等于最慢的命令"""
+    ports, range_result, hyperv, wsl = await asyncio.gather(
+        get_excluded_ports(timeout),
+        get_dynamic_port_range(timeout),
+        get_hyperv_status(timeout),
+        get_wsl_status(timeout),
+    )
+    return {
+        'excluded_ports': ports[0],
+        'excluded_error': ports[1],
+        'dynamic_range': range_result[0],
+        'dynamic_error': range_result[1],
+        'hyperv': list(hyperv),
+        'wsl': list(wsl),
+    }
+
+
+def collect_status_sync(timeout=DEFAULT_TIMEOUT):
+    """collect_status 的同步包装，供线程或脚本调用"""
+    return asyncio.run(collect_status(timeout))
+
+
+def _benchmark():
+    """用带延迟的模拟后端比较顺序收集和并发收集的耗时"""
+    from port_simulator import PortStackSimulator
+
+    simulator = PortStackSimulator()
+    delays = {"netsh": 0.2, "dism": 0.8, "sc": 0.1}
+
+    def slow_backend(cmd, shell=True):
+        time.sleep(delays.get(cmd.split()[0], 0))
+        return simulator(cmd, shell)
+
+    previous = port_manager.set_command_backend(slow_backend)
+    try:
+        start = time.perf_counter()
+        port_manager.get_excluded_ports()
+        port_manager.get_dynamic_port_range()
+        port_manager.get_hyperv_status()
+        port_manager.get_wsl_status()
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        collect_status_sync()
+        concurrent = time.perf_counter() - start
+    finally:
+        port_manager.set_command_backend(previous)
+
+    print(f"顺序收集 {sequential:.2f} 秒，并发收集 {concurrent:.2f} 秒（最慢命令 {max(delays.values()):.2f} 秒）")
+
+
+if __name__ == "__main__":
+    _benchmark()
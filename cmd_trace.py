@@ -0,0 +1,223 @@
+"""
+命令录制与回放
+录制模式把每条命令的原始字节输出、退出码和耗时写入紧凑的 gzip 轨迹文件；
+回放时把轨迹作为 port_manager 的命令后端，在任意平台上重现真实机器的行为并做性能测试
+"""
+import gzip
+import struct
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+import port_manager
+
+MAGIC = b"PMTR"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+# 开始偏移秒, 耗时秒, 退出码, 命令长度, stdout 长度, stderr 长度
+RECORD = struct.Struct("<ddqIII")
+READ_CHUNK = 64 << 10
+
+TraceRecord = namedtuple("TraceRecord", "cmd stdout stderr code start duration")
+
+
+def _to_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    return (data or "").encode("gbk", errors="ignore")
+
+
+class RecordingBackend:
+    """包装另一个后端，执行命令的同时把结果追加写入轨迹文件"""
+
+    def __init__(self, path, inner=None):
+        self.inner = inner or port_manager.get_command_backend()
+        self._file = gzip.open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, cmd, shell=True):
+        start = time.perf_counter()
+        stdout, stderr, code = self.inner(cmd, shell)
+        self.record(cmd, stdout, stderr, code, start, time.perf_counter() - start)
+        return stdout, stderr, code
+
+    def record(self, cmd, stdout, stderr, code, start, duration):
+        """
+        追加一条记录，start 为 time.perf_counter() 读数
+
+        async_port_manager 在包装的是真实执行后端时自己用 asyncio 子进程执行命令，
+        再通过这里写入结果，录制不改变异步路径的并发和超时行为
+        """
+        cmd_bytes = (cmd if isinstance(cmd, str) else " ".join(cmd)).encode("utf-8")
+        out, err = _to_bytes(stdout), _to_bytes(stderr)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(RECORD.pack(start - self._origin, duration, code,
+                                             len(cmd_bytes), len(out), len(err)))
+                self._file.write(cmd_bytes + out + err)
+                # 每条记录后刷新，程序异常退出也能保留已录制内容
+                self._file.flush()
+                self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def start_recording(path):
+    """开始录制 port_manager 执行的所有命令，返回录制后端"""
+    recorder = RecordingBackend(path)
+    port_manager.set_command_backend(recorder)
+    return recorder
+
+
+def stop_recording(recorder):
+    """停止录制并恢复原来的后端"""
+    if port_manager.get_command_backend() is recorder:
+        port_manager.set_command_backend(recorder.inner)
+    recorder.close()
+
+
+def load_trace(path):
+    """读取轨迹文件，返回 TraceRecord 列表（文件被截断时返回已完整写入的部分）"""
+    records = []
+    # 程序异常退出时 gzip 流缺少结尾，整体 read() 会丢弃已解压的内容，因此分块读取
+    chunks = []
+    with gzip.open(path, "rb") as f:
+        try:
+            while True:
+                chunk = f.read1(READ_CHUNK)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except EOFError:
+            pass
+    data = b"".join(chunks)
+    if len(data) < FILE_HEADER.size:
+        raise ValueError("不是有效的命令轨迹文件")
+    magic, version = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("不是有效的命令轨迹文件")
+
+    pos = FILE_HEADER.size
+    while pos + RECORD.size <= len(data):
+        start, duration, code, cmd_len, out_len, err_len = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        end = pos + cmd_len + out_len + err_len
+        if end > len(data):
+            break
+        cmd = data[pos:pos + cmd_len].decode("utf-8")
+        stdout = data[pos + cmd_len:pos + cmd_len + out_len]
+        stderr = data[pos + cmd_len + out_len:end]
+        records.append(TraceRecord(cmd, stdout, stderr, code, start, duration))
+        pos = end
+    return records
+
+
+class ReplayBackend:
+    """
+    按命令回放录制结果
+
+    同一命令的多次录制按顺序依次返回，用完后循环，因此每次运行结果确定；
+    speed 为 None 或 0 时立即返回，1 为按录制耗时，大于 1 为加速回放
+    """
+
+    def __init__(self, records, speed=None):
+        self.speed = speed
+        self._queues = {}
+        for record in records:
+            self._queues.setdefault(record.cmd, deque()).append(record)
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def __call__(self, cmd, shell=True):
+        key = cmd if isinstance(cmd, str) else " ".join(cmd)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.misses += 1
+                return b"", f"轨迹中没有该命令: {key}".encode("gbk"), 1
+            record = queue[0]
+            queue.rotate(-1)
+        if self.speed:
+            time.sleep(record.duration / self.speed)
+        return record.stdout, record.stderr, record.code
+
+
+def replay_benchmark(path, repeat=100, speed=None):
+    """
+    用轨迹回放 port_manager 的状态读取和界面刷新的数据处理，返回各阶段平均耗时（秒）
+
+    界面部分测量列表所需的服务标注、WSL 合并以及热力图的分类和图像生成，不需要图形环境
+    """
+    from async_port_manager import collect_status_sync
+    from port_heatmap import classify_ports, render_ppm
+    from port_registry import describe_range
+    from wsl_listeners import merge_with_exclusions
+
+    backend = ReplayBackend(load_trace(path), speed)
+    previous = port_manager.set_command_backend(backend)
+    timings = {'get_excluded_ports': 0.0, 'get_dynamic_port_range': 0.0,
+               'get_hyperv_status': 0.0, 'get_wsl_status': 0.0,
+               'collect_status': 0.0, 'gui_refresh': 0.0}
+    try:
+        for _ in range(repeat):
+            for name in ('get_excluded_ports', 'get_dynamic_port_range',
+                         'get_hyperv_status', 'get_wsl_status'):
+                start = time.perf_counter()
+                getattr(port_manager, name)()
+                timings[name] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            snapshot = collect_status_sync()
+            timings['collect_status'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            ports = merge_with_exclusions(snapshot['excluded_ports'], bytearray(65536))
+            for item in ports:
+                describe_range(item['start'], item['end'], limit=2)
+            render_ppm(classify_ports(snapshot['dynamic_range'], ports))
+            timings['gui_refresh'] += time.perf_counter() - start
+    finally:
+        port_manager.set_command_backend(previous)
+
+    result = {name: total / repeat for name, total in timings.items()}
+    result['misses'] = backend.misses
+    return result
+
+
+def main(argv=None):
+    """命令行入口：python cmd_trace.py show|replay 轨迹文件"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看或回放命令轨迹")
+    sub = parser.add_subparsers(dest="action", required=True)
+    show = sub.add_parser("show", help="列出轨迹中的命令")
+    show.add_argument("trace")
+    replay = sub.add_parser("replay", help="回放轨迹并统计耗时")
+    replay.add_argument("trace")
+    replay.add_argument("--repeat", type=int, default=100)
+    replay.add_argument("--speed", type=float, default=0, help="0 为不等待，1 为按录制耗时，大于 1 为加速")
+    args = parser.parse_args(argv)
+
+    if args.action == "show":
+        for record in load_trace(args.trace):
+            print(f"{record.start:9.3f}s  {record.duration * 1000:8.1f}ms  code={record.code:<5} "
+                  f"out={len(record.stdout):<6} {record.cmd}")
+        return 0
+
+    result = replay_benchmark(args.trace, args.repeat, args.speed or None)
+    for name, value in result.items():
+        if name == 'misses':
+            print(f"{'未命中命令':<24}{value}")
+        else:
+            print(f"{name:<24}{value * 1000:8.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
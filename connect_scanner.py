@@ -0,0 +1,294 @@
+"""
+异步 TCP 连接扫描
+探测 localhost、WSL 和 Hyper-V 虚拟机 NAT 地址上的端口是否有服务在监听，结果按端口合并
+"""
+import asyncio
+import errno
+import socket
+import sys
+import time
+
+from port_manager import run_cmd
+
+OPEN = "open"
+CLOSED = "closed"
+FILTERED = "filtered"
+
+DEFAULT_CONCURRENCY = 512
+
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN}
+_REFUSED = {errno.ECONNREFUSED, getattr(errno, "WSAECONNREFUSED", errno.ECONNREFUSED)}
+# Windows 的 Proactor 事件循环不支持 add_writer，只能走 sock_connect
+_FAST_CONNECT = sys.platform != "win32"
+
+
+class AdaptiveTimeout:
+    """按 RFC 6298 的平滑往返时间估算连接超时"""
+
+    def __init__(self, initial=1.0, minimum=0.05, maximum=3.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.value = initial
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, rtt):
+        """根据一次有响应（打开或拒绝）的往返时间更新超时"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.value = min(self.maximum, max(self.minimum, self.srtt + 4 * self.rttvar))
+
+
+def _connected_state(sock):
+    """
+    连接成功后的状态
+
+    扫描回环地址时内核可能恰好选中与目标相同的源端口，形成 TCP 自连接，
+    此时并没有服务在监听，按 closed 处理
+    """
+    try:
+        if sock.getsockname() == sock.getpeername():
+            return CLOSED
+    except OSError:
+        return CLOSED
+    return OPEN
+
+
+def _settled_state(sock):
+    """connect 已有结果时返回状态，仍在进行中返回 None"""
+    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if err:
+        return CLOSED if err in _REFUSED else FILTERED
+    try:
+        sock.getpeername()
+    except OSError:
+        return None
+    return _connected_state(sock)
+
+
+def _wake(fut, writable):
+    if not fut.done():
+        fut.set_result(writable)
+
+
+async def _connect_fast(loop, sock, address, timeout):
+    """非阻塞 connect，回环地址上大多数探测无需进入事件循环即可完成，其余用 add_writer 等待"""
+    err = sock.connect_ex(address)
+    if err == 0:
+        return _connected_state(sock)
+    if err in _REFUSED:
+        return CLOSED
+    if err not in _IN_PROGRESS:
+        return FILTERED
+
+    # 回环地址上 connect 返回时握手通常已经完成或被拒绝，直接取结果，不注册事件
+    state = _settled_state(sock)
+    if state is not None:
+        return state
+
+    fut = loop.create_future()
+    fd = sock.fileno()
+    loop.add_writer(fd, _wake, fut, True)
+    timer = loop.call_later(timeout, _wake, fut, False)
+    try:
+        writable = await fut
+    finally:
+        loop.remove_writer(fd)
+        timer.cancel()
+    if not writable:
+        return FILTERED
+
+    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if err == 0:
+        return _connected_state(sock)
+    return CLOSED if err in _REFUSED else FILTERED
+
+
+async def _connect_portable(loop, sock, address, timeout):
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, address), timeout)
+        return _connected_state(sock)
+    except ConnectionRefusedError:
+        return CLOSED
+    except (asyncio.TimeoutError, OSError):
+        return FILTERED
+
+
+async def probe(host, port, timeout=1.0, family=None):
+    """探测单个端口，返回 (状态, 耗时秒)"""
+    loop = asyncio.get_running_loop()
+    family = family or (socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    start = time.perf_counter()
+    try:
+        if _FAST_CONNECT:
+            state = await _connect_fast(loop, sock, (host, port), timeout)
+        else:
+            state = await _connect_portable(loop, sock, (host, port), timeout)
+    finally:
+        sock.close()
+    return state, time.perf_counter() - start
+
+
+def _resolve(host):
+    """解析主机名，返回 (地址, 地址族)"""
+    info = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0]
+    return info[4][0], info[0]
+
+
+async def scan(hosts, ports, concurrency=DEFAULT_CONCURRENCY, timeout=None, include_closed=False):
+    """
+    并发扫描 hosts × ports
+
+    concurrency 为同时进行的探测数；timeout 为 None 时每个主机使用自适应超时。
+    返回 {'ports': {端口: {主机: 状态}}, 'probes', 'elapsed', 'open': [(主机, 端口)]}，
+    默认不记录 closed 状态以保持结果表紧凑
+    """
+    ports = list(ports)
+    resolved = {host: _resolve(host) for host in hosts}
+    timeouts = {host: AdaptiveTimeout() for host in hosts}
+    table = {}
+    opened = []
+    targets = ((host, port) for host in hosts for port in ports)
+    probes = 0
+
+    async def worker():
+        nonlocal probes
+        for host, port in targets:
+            address, family = resolved[host]
+            limit = timeout if timeout is not None else timeouts[host].value
+            state, rtt = await probe(address, port, limit, family)
+            probes += 1
+            if state != FILTERED:
+                timeouts[host].update(rtt)
+            if state == OPEN:
+                opened.append((host, port))
+            if state != CLOSED or include_closed:
+                table.setdefault(port, {})[host] = state
+
+    start = time.perf_counter()
+    workers = max(1, min(concurrency, len(hosts) * len(ports)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return {
+        'ports': dict(sorted(table.items())),
+        'probes': probes,
+        'elapsed': time.perf_counter() - start,
+        'open': sorted(opened, key=lambda item: (item[1], item[0])),
+    }
+
+
+def scan_hosts(hosts, ports, concurrency=DEFAULT_CONCURRENCY, timeout=None, include_closed=False):
+    """scan 的同步包装"""
+    return asyncio.run(scan(hosts, ports, concurrency, timeout, include_closed))
+
+
+def get_wsl_host():
+    """
+    获取正在运行的 WSL 发行版的 IP 地址，没有发行版运行时返回 None
+
+    不会为此启动 WSL，否则 winnat 会新增端口预留
+    """
+    from wsl_listeners import get_running_distros
+
+    distros = get_running_distros()
+    if not distros:
+        return None
+    stdout, stderr, code = run_cmd(f'wsl -d "{distros[0]}" hostname -I')
+    if code != 0:
+        return None
+    parts = stdout.split()
+    return parts[0] if parts else None
+
+
+def get_vm_hosts():
+    """获取 Hyper-V 虚拟机网卡的 IPv4 地址"""
+    stdout, stderr, code = run_cmd(
+        'powershell -NoProfile -Command "Get-VM | Get-VMNetworkAdapter | '
+        'Select-Object -ExpandProperty IPAddresses"'
+    )
+    if code != 0:
+        return []
+    return [line.strip() for line in stdout.splitlines() if line.strip().count(".") == 3]
+
+
+def parse_ports(text):
+    """解析 '3000,8080-8090' 形式的端口列表"""
+    ports = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = map(int, part.split("-"))
+            ports.extend(range(start, end + 1))
+        else:
+            ports.append(int(part))
+    return ports
+
+
+def _benchmark(count=20000, listeners=20):
+    """在回环地址上开启若干监听并扫描 count 个端口，统计探测速率"""
+    servers = []
+    base = 20000
+    for port in range(base, base + count, max(1, count // listeners)):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("127.0.0.1", port))
+            s.listen(16)
+            servers.append(s)
+        except OSError:
+            s.close()
+    expected = {s.getsockname()[1] for s in servers}
+    try:
+        result = scan_hosts(["127.0.0.1"], range(base, base + count))
+    finally:
+        for s in servers:
+            s.close()
+    rate = result['probes'] / result['elapsed']
+    found = {port for _, port in result['open']}
+    print(f"{result['probes']} 次探测耗时 {result['elapsed']:.2f} 秒 ({rate:,.0f} 次/秒)，"
+          f"测试监听 {len(expected & found)}/{len(expected)} 个，其他已有监听 {len(found - expected)} 个")
+
+
+def main(argv=None):
+    """命令行入口：python connect_scanner.py -p 3000-3010 [--wsl] [--vm] [主机...]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="扫描本机、WSL 和虚拟机上正在监听的端口")
+    parser.add_argument("hosts", nargs="*", help="要扫描的主机，默认 127.0.0.1")
+    parser.add_argument("-p", "--ports", help="端口列表，如 3000,8080-8090")
+    parser.add_argument("--wsl", action="store_true", help="同时扫描 WSL 发行版地址")
+    parser.add_argument("--vm", action="store_true", help="同时扫描 Hyper-V 虚拟机地址")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="固定超时秒数，默认自适应")
+    parser.add_argument("--benchmark", action="store_true", help="在回环地址上测试探测速率")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        _benchmark()
+        return 0
+    if not args.ports:
+        parser.error("需要指定 --ports")
+
+    hosts = args.hosts or ["127.0.0.1"]
+    if args.wsl:
+        wsl_host = get_wsl_host()
+        if wsl_host:
+            hosts.append(wsl_host)
+    if args.vm:
+        hosts.extend(get_vm_hosts())
+
+    result = scan_hosts(hosts, parse_ports(args.ports), args.concurrency, args.timeout)
+    for port, states in result['ports'].items():
+        print(f"{port:>5}  " + "  ".join(f"{host}={state}" for host, state in states.items()))
+    print(f"共探测 {result['probes']} 次，耗时 {result['elapsed']:.2f} 秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+动态端口消耗采样与耗尽预警
+定期解析 netstat 连接表，统计动态端口范围内已占用和 TIME_WAIT 的端口数
+"""
+import threading
+import time
+from collections import deque
+
+from port_manager import run_cmd, get_dynamic_port_range
+
+NETSTAT_CMD = "netstat -an -p tcp"
+
+
+def parse_connections(stdout, start, end):
+    """
+    单次遍历 netstat 输出，统计 [start, end] 内的端口使用情况
+
+    返回 {'in_use', 'time_wait', 'listening', 'connections'}，
+    in_use / time_wait 按本地端口去重计数，listening 为全部监听端口列表
+    """
+    in_use = bytearray(65536)
+    time_wait = bytearray(65536)
+    listening = set()
+    connections = 0
+
+    for line in stdout.splitlines():
+        parts = line.split(None, 4)
+        if len(parts) < 4 or parts[0] != 'TCP':
+            continue
+        port = parts[1].rpartition(':')[2]
+        if not port.isdigit():
+            continue
+        port = int(port)
+        state = parts[3]
+        connections += 1
+        if state == 'LISTENING':
+            listening.add(port)
+        if start <= port <= end:
+            in_use[port] = 1
+            if state == 'TIME_WAIT':
+                time_wait[port] = 1
+
+    return {
+        'in_use': 65536 - in_use.count(0),
+        'time_wait': 65536 - time_wait.count(0),
+        'listening': sorted(listening),
+        'connections': connections,
+    }
+
+
+def estimate_time_to_exhaustion(samples, capacity):
+    """对窗口内的占用数做最小二乘线性拟合，返回预计耗尽的秒数，不增长时返回 None"""
+    n = len(samples)
+    if n < 2:
+        return None
+    t0 = samples[0]['time']
+    xs = [s['time'] - t0 for s in samples]
+    ys = [s['in_use'] for s in samples]
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+    if slope <= 0:
+        return None
+    return max(0.0, (capacity - ys[-1]) / slope)
+
+
+class EphemeralPortMonitor:
+    """周期性采样动态端口消耗，维护固定长度的滑动窗口并触发预警"""
+
+    def __init__(self, interval=5.0, window=60, warn_ratio=0.8, critical_ratio=0.95,
+                 warn_seconds=300, on_sample=None, on_alert=None):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.warn_ratio = warn_ratio
+        self.critical_ratio = critical_ratio
+        self.warn_seconds = warn_seconds
+        self.on_sample = on_sample
+        self.on_alert = on_alert
+        self.range_start = 49152
+        self.range_count = 16384
+        self.alert_level = None
+        self.listening = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh_range(self):
+        """重新读取当前动态端口范围"""
+        range_info, _ = get_dynamic_port_range()
+        if range_info:
+            self.range_start = range_info['start']
+            self.range_count = range_info['count']
+
+    def sample_once(self):
+        """采样一次并返回样本"""
+        stdout, stderr, code = run_cmd(NETSTAT_CMD)
+        if code != 0:
+            return None
+
+        end = self.range_start + self.range_count - 1
+        stats = parse_connections(stdout, self.range_start, end)
+        sample = {
+            'time': time.monotonic(),
+            'in_use': stats['in_use'],
+            'time_wait': stats['time_wait'],
+            'connections': stats['connections'],
+            'capacity': self.range_count,
+            'usage': stats['in_use'] / self.range_count if self.range_count else 0.0,
+        }
+        self.listening = stats['listening']
+        self.samples.append(sample)
+        sample['time_to_exhaustion'] = estimate_time_to_exhaustion(self.samples, self.range_count)
+
+        if self.on_sample:
+            self.on_sample(sample)
+        self._check_alert(sample)
+        return sample
+
+    def _check_alert(self, sample):
+        """根据使用率和耗尽预估判断预警级别，级别变化时回调"""
+        tte = sample['time_to_exhaustion']
+        level = None
+        msg = ""
+        if sample['usage'] >= self.critical_ratio:
+            level = "critical"
+            msg = f"动态端口即将耗尽: 已用 {sample['usage']:.0%}，TIME_WAIT {sample['time_wait']}"
+        elif sample['usage'] >= self.warn_ratio or (tte is not None and tte <= self.warn_seconds):
+            level = "warning"
+            msg = f"动态端口使用率 {sample['usage']:.0%}，TIME_WAIT {sample['time_wait']}"
+            if tte is not None:
+                msg += f"，预计 {tte:.0f} 秒后耗尽"
+
+        if level != self.alert_level:
+            self.alert_level = level
+            if level and self.on_alert:
+                self.on_alert(level, msg, sample)
+
+    def start(self):
+        """启动后台采样线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            self.refresh_range()
+            while not self._stop.is_set():
+                self.sample_once()
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台采样"""
+        self._stop.set()
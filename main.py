@@ -2,24 +2,34 @@
 Windows 端口预留管理工具 - GUI界面
 """
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import multiprocessing
 import threading
 
-from port_manager import (
-    is_admin, run_as_admin,
-    get_excluded_ports, get_dynamic_port_range, set_dynamic_port_range,
-    add_port_exclusion, delete_port_exclusion,
-    check_port_available,
-    get_hyperv_status, set_hyperv,
-    get_wsl_status, set_wsl,
-    fix_common_ports
-)
+import sys
+
+from port_manager import is_admin, check_port_available
 from config_manager import load_config, save_config
+from ephemeral_monitor import EphemeralPortMonitor
+from wsl_listeners import collect_wsl_listeners, merge_with_exclusions, listener_ports
+from snapshot_cache import get_shared_cache
+from workspace_scanner import scan_workspace, merge_into_config
+from port_heatmap import PortHeatmap
+from port_registry import lookup_service, describe_range
+from range_impact import analyze_range_change, format_impact, real_conflicts
+from cmd_trace import start_recording, stop_recording
+from admin_helper import (
+    LocalOperations, HelperOperations, HelperError, HelperDisconnected,
+    start_elevated_helper, run_helper
+)
 
 
 class PortManagerApp:
-    def __init__(self, root):
+    def __init__(self, root, ops=None):
         self.root = root
+        # 端口管理操作：本进程直接执行，或转发给管理员助手
+        self.ops = ops or LocalOperations()
+        self.elevated = is_admin() or isinstance(self.ops, HelperOperations)
         self.root.title("Windows 端口预留管理工具")
         self.root.geometry("900x540")
         self.root.minsize(820, 480)
@@ -28,6 +38,10 @@ class PortManagerApp:
         # 加载配置
         self.config = load_config()
 
+        # 最近一次刷新得到的数据，输入动态端口范围时据此实时分析影响
+        self.impact_inputs = {'current': None, 'exclusions': [], 'wsl_listeners': []}
+        self._impact_job = None
+
         # 设置样式
         self.setup_styles()
 
@@ -37,6 +51,13 @@ class PortManagerApp:
         # 初始加载数据
         self.refresh_all()
 
+        # 动态端口消耗采样
+        self.port_monitor = EphemeralPortMonitor(
+            on_sample=lambda sample: self.root.after(0, lambda: self.update_usage_label(sample)),
+            on_alert=lambda level, msg, sample: self.root.after(0, lambda: self.show_status(msg, error=True))
+        )
+        self.port_monitor.start()
+
     def setup_styles(self):
         """设置界面样式"""
         style = ttk.Style()
@@ -77,8 +98,16 @@ class PortManagerApp:
         # ===== 端口保护管理 =====
         self.create_port_protection_section(left_panel)
 
-        # ===== 被预留端口列表 =====
-        self.create_excluded_ports_list(right_panel)
+        # ===== 被预留端口列表 / 热力图 =====
+        notebook = ttk.Notebook(right_panel)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        list_tab = ttk.Frame(notebook)
+        heatmap_tab = ttk.Frame(notebook)
+        notebook.add(list_tab, text="列表")
+        notebook.add(heatmap_tab, text="热力图")
+
+        self.create_excluded_ports_list(list_tab)
+        self.create_heatmap(heatmap_tab)
 
         # ===== 底部按钮 =====
         self.create_bottom_buttons(main_frame)
@@ -89,20 +118,29 @@ class PortManagerApp:
         status_frame.pack(fill=tk.X, pady=(0, 10))
 
         # 管理员状态
-        admin_status = "✓ 管理员权限" if is_admin() else "✗ 需要管理员权限"
-        admin_color = "green" if is_admin() else "red"
+        if is_admin():
+            admin_status = "✓ 管理员权限"
+        elif self.elevated:
+            admin_status = "✓ 管理员助手"
+        else:
+            admin_status = "✗ 需要管理员权限"
+        admin_color = "green" if self.elevated else "red"
         self.admin_label = ttk.Label(status_frame, text=admin_status, foreground=admin_color)
         self.admin_label.pack(side=tk.LEFT, padx=10)
 
         # 动态端口范围显示
         self.port_range_label = ttk.Label(status_frame, text="动态端口范围: 加载中...")
-        self.port_range_label.pack(side=tk.LEFT, padx=20, fill=tk.X, expand=True)
+        self.port_range_label.pack(side=tk.LEFT, padx=20)
+
+        # 动态端口使用率显示
+        self.usage_label = ttk.Label(status_frame, text="")
+        self.usage_label.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
 
         # 右侧操作按钮
         action_frame = ttk.Frame(status_frame)
         action_frame.pack(side=tk.RIGHT)
         ttk.Button(action_frame, text="保存配置", command=self.save_current_config, width=10).pack(side=tk.LEFT, padx=2)
-        ttk.Button(action_frame, text="刷新", command=self.refresh_all, width=8).pack(side=tk.LEFT, padx=2)
+        ttk.Button(action_frame, text="刷新", command=lambda: self.refresh_all(force=True), width=8).pack(side=tk.LEFT, padx=2)
 
     def create_feature_controls(self, parent):
         """创建 Hyper-V 和 WSL 控制区"""
@@ -171,6 +209,12 @@ class PortManagerApp:
                               foreground="gray")
         tip_label.pack(anchor=tk.W)
 
+        # 变更影响
+        self.impact_label = ttk.Label(range_frame, text="", wraplength=360, justify=tk.LEFT)
+        self.impact_label.pack(anchor=tk.W, pady=(5, 0))
+        self.start_port_var.trace_add("write", lambda *args: self.schedule_impact_update())
+        self.port_count_var.trace_add("write", lambda *args: self.schedule_impact_update())
+
     def create_port_protection_section(self, parent):
         """创建端口保护管理区"""
         protect_frame = ttk.LabelFrame(parent, text="端口保护 (立即生效)", padding="10")
@@ -192,6 +236,8 @@ class PortManagerApp:
         ttk.Button(action_frame, text="添加保护", command=self.add_protection).pack(side=tk.LEFT, padx=2)
         ttk.Button(action_frame, text="删除保护", command=self.remove_protection).pack(side=tk.LEFT, padx=2)
         ttk.Button(action_frame, text="检测端口", command=self.check_single_port).pack(side=tk.LEFT, padx=2)
+        ttk.Button(action_frame, text="重启 winnat 并保护", command=self.reclaim_protection).pack(side=tk.LEFT, padx=2)
+        ttk.Button(action_frame, text="扫描项目端口", command=self.scan_projects).pack(side=tk.LEFT, padx=2)
 
     def create_excluded_ports_list(self, parent):
         """创建被预留端口列表"""
@@ -199,18 +245,22 @@ class PortManagerApp:
         list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 6))
 
         # 创建表格
-        columns = ("start", "end", "count", "type")
+        columns = ("start", "end", "count", "type", "services", "wsl")
         self.ports_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=10)
 
         self.ports_tree.heading("start", text="起始端口")
         self.ports_tree.heading("end", text="结束端口")
         self.ports_tree.heading("count", text="数量")
         self.ports_tree.heading("type", text="类型")
+        self.ports_tree.heading("services", text="包含服务")
+        self.ports_tree.heading("wsl", text="WSL 监听")
 
-        self.ports_tree.column("start", width=100, anchor=tk.CENTER)
-        self.ports_tree.column("end", width=100, anchor=tk.CENTER)
-        self.ports_tree.column("count", width=80, anchor=tk.CENTER)
-        self.ports_tree.column("type", width=150, minwidth=130, anchor=tk.CENTER, stretch=True)
+        self.ports_tree.column("start", width=70, anchor=tk.CENTER)
+        self.ports_tree.column("end", width=70, anchor=tk.CENTER)
+        self.ports_tree.column("count", width=60, anchor=tk.CENTER)
+        self.ports_tree.column("type", width=100, minwidth=90, anchor=tk.CENTER, stretch=True)
+        self.ports_tree.column("services", width=160, minwidth=100, anchor=tk.W, stretch=True)
+        self.ports_tree.column("wsl", width=120, minwidth=80, anchor=tk.CENTER, stretch=True)
 
         # 滚动条
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.ports_tree.yview)
@@ -223,6 +273,14 @@ class PortManagerApp:
         self.stats_label = ttk.Label(list_frame, text="")
         self.stats_label.pack(anchor=tk.W, pady=(5, 0))
 
+    def create_heatmap(self, parent):
+        """创建全端口热力图"""
+        heatmap_frame = ttk.LabelFrame(parent, text="端口分布 (0-65535)", padding="10")
+        heatmap_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 6))
+
+        self.heatmap = PortHeatmap(heatmap_frame)
+        self.heatmap.pack(fill=tk.BOTH, expand=True)
+
     def create_bottom_buttons(self, parent):
         """创建底部按钮"""
         btn_frame = ttk.Frame(parent)
@@ -234,13 +292,25 @@ class PortManagerApp:
 
     # ===== 功能方法 =====
 
-    def refresh_all(self):
-        """刷新所有数据"""
+    def refresh_all(self, force=False):
+        """刷新所有数据，force 为 True 时忽略缓存重新读取"""
         self.show_status("正在刷新...")
 
         def do_refresh():
+            # 优先使用跨进程共享的快照，避免多个实例重复执行 netsh / dism
+            try:
+                try:
+                    cache = get_shared_cache()
+                    cache.collector = self.ops.collect_snapshot
+                    snapshot = cache.get(force=force)
+                except OSError:
+                    snapshot = self.ops.collect_snapshot()
+            except (HelperError, OSError) as e:
+                self.root.after(0, lambda e=e: self.ops_failed(e))
+                return
+
             # 刷新动态端口范围
-            range_info, err = get_dynamic_port_range()
+            range_info = snapshot['dynamic_range']
             if range_info:
                 self.root.after(0, lambda: self.port_range_label.config(
                     text=f"动态端口范围: {range_info['start']} - {range_info['start'] + range_info['count'] - 1}"
@@ -249,18 +319,25 @@ class PortManagerApp:
                 self.root.after(0, lambda: self.port_count_var.set(str(range_info['count'])))
 
             # 刷新 Hyper-V 状态
-            hyperv_enabled, hyperv_msg = get_hyperv_status()
+            hyperv_enabled, hyperv_msg = snapshot['hyperv']
             color = "green" if hyperv_enabled else "gray"
             self.root.after(0, lambda: self.hyperv_status_label.config(text=hyperv_msg, foreground=color))
 
             # 刷新 WSL 状态
-            wsl_enabled, wsl_msg = get_wsl_status()
+            wsl_enabled, wsl_msg = snapshot['wsl']
             color = "green" if wsl_enabled else "gray"
             self.root.after(0, lambda: self.wsl_status_label.config(text=wsl_msg, foreground=color))
 
             # 刷新端口列表
-            ports, err = get_excluded_ports()
+            ports = snapshot['excluded_ports']
+            wsl_table, _ = collect_wsl_listeners()
+            listeners = listener_ports(wsl_table)
+            ports = merge_with_exclusions(ports, wsl_table)
             self.root.after(0, lambda: self.update_ports_list(ports))
+            self.root.after(0, lambda: self.set_impact_inputs(range_info, ports, listeners))
+            self.root.after(0, lambda: self.heatmap.update_snapshot(
+                range_info, ports, self.config["protected_ports"], listeners
+            ))
 
             self.root.after(0, lambda: self.show_status("刷新完成"))
 
@@ -274,22 +351,74 @@ class PortManagerApp:
 
         total_count = 0
         admin_count = 0
+        conflict_count = 0
 
         for port in ports:
             port_type = "管理员排除 *" if port['is_admin'] else "系统预留"
+            wsl_ports = port.get('wsl_listeners', [])
+            wsl_text = ", ".join(map(str, wsl_ports[:3])) + (" ..." if len(wsl_ports) > 3 else "")
             self.ports_tree.insert("", tk.END, values=(
                 port['start'],
                 port['end'],
                 port['count'],
-                port_type
+                port_type,
+                describe_range(port['start'], port['end'], limit=2),
+                wsl_text
             ))
             total_count += port['count']
+            conflict_count += len(wsl_ports)
             if port['is_admin']:
                 admin_count += port['count']
 
-        self.stats_label.config(
-            text=f"共 {len(ports)} 个范围，{total_count} 个端口被预留 (其中 {admin_count} 个为管理员排除)"
-        )
+        stats = f"共 {len(ports)} 个范围，{total_count} 个端口被预留 (其中 {admin_count} 个为管理员排除)"
+        if conflict_count:
+            stats += f"，{conflict_count} 个 WSL 监听端口位于预留范围内"
+        self.stats_label.config(text=stats)
+
+    def update_usage_label(self, sample):
+        """更新动态端口使用率显示"""
+        text = f"已用: {sample['in_use']}/{sample['capacity']} ({sample['usage']:.0%})  TIME_WAIT: {sample['time_wait']}"
+        color = "red" if self.port_monitor.alert_level else "black"
+        self.usage_label.config(text=text, foreground=color)
+
+    def set_impact_inputs(self, range_info, ports, wsl_listeners):
+        """保存刷新结果并重新分析当前输入的范围"""
+        self.impact_inputs = {'current': range_info, 'exclusions': ports, 'wsl_listeners': wsl_listeners}
+        self.update_impact()
+
+    def schedule_impact_update(self):
+        """输入变化后稍作延迟再分析，连续输入时只分析最后一次"""
+        if self._impact_job is not None:
+            self.root.after_cancel(self._impact_job)
+        self._impact_job = self.root.after(150, self.update_impact)
+
+    def analyze_impact(self):
+        """分析输入框中的动态端口范围，输入无效时返回 None"""
+        try:
+            start = int(self.start_port_var.get())
+            count = int(self.port_count_var.get())
+        except ValueError:
+            return None
+        if count < 255 or not 1025 <= start <= 65535 or start + count > 65536:
+            return None
+
+        inputs = self.impact_inputs
+        monitor = getattr(self, 'port_monitor', None)
+        listeners = list(inputs['wsl_listeners'])
+        if monitor:
+            listeners += monitor.listening
+        return analyze_range_change(start, count, inputs['current'], inputs['exclusions'],
+                                    listeners, self.config["protected_ports"])
+
+    def update_impact(self):
+        """更新变更影响显示"""
+        self._impact_job = None
+        report = self.analyze_impact()
+        if report is None:
+            self.impact_label.config(text="请输入有效的端口范围", foreground="gray")
+            return
+        color = "red" if real_conflicts(report) else "gray"
+        self.impact_label.config(text=format_impact(report, limit=3), foreground=color)
 
     def toggle_feature(self, feature, enable):
         """切换 Hyper-V 或 WSL"""
@@ -302,10 +431,14 @@ class PortManagerApp:
         self.show_status(f"正在{action} {feature_name}...")
 
         def do_toggle():
-            if feature == "hyperv":
-                success, msg = set_hyperv(enable)
-            else:
-                success, msg = set_wsl(enable)
+            try:
+                if feature == "hyperv":
+                    success, msg = self.ops.set_hyperv(enable)
+                else:
+                    success, msg = self.ops.set_wsl(enable)
+            except (HelperError, OSError) as e:
+                self.root.after(0, lambda e=e: self.ops_failed(e))
+                return
 
             self.root.after(0, lambda: self.show_result(success, msg))
             self.root.after(0, self.refresh_all)
@@ -321,10 +454,16 @@ class PortManagerApp:
             messagebox.showerror("错误", "请输入有效的数字")
             return
 
-        if not messagebox.askyesno("确认", f"设置动态端口范围为 {start} - {start + count - 1}？\n此操作需要重启电脑生效。"):
+        report = self.analyze_impact()
+        impact = f"\n\n{format_impact(report, limit=8)}" if report else ""
+        if not messagebox.askyesno("确认", f"设置动态端口范围为 {start} - {start + count - 1}？{impact}\n\n此操作需要重启电脑生效。"):
             return
 
-        success, msg = set_dynamic_port_range(start, count)
+        try:
+            success, msg = self.ops.set_dynamic_port_range(start, count)
+        except (HelperError, OSError) as e:
+            self.ops_failed(e)
+            return
         self.show_result(success, msg)
 
         if success:
@@ -337,7 +476,11 @@ class PortManagerApp:
         if not messagebox.askyesno("确认", "将动态端口范围设为 49152-65535，释放常用开发端口？\n此操作需要重启电脑生效。"):
             return
 
-        success, msg = fix_common_ports()
+        try:
+            success, msg = self.ops.fix_common_ports()
+        except (HelperError, OSError) as e:
+            self.ops_failed(e)
+            return
         self.show_result(success, msg)
 
         if success:
@@ -361,7 +504,11 @@ class PortManagerApp:
             messagebox.showerror("错误", "格式错误，请输入如 3000 或 3000-3010")
             return
 
-        success, msg = add_port_exclusion(start, end)
+        try:
+            success, msg = self.ops.add_port_exclusion(start, end)
+        except (HelperError, OSError) as e:
+            self.ops_failed(e)
+            return
         self.show_result(success, msg)
 
         if success:
@@ -386,7 +533,11 @@ class PortManagerApp:
             messagebox.showerror("错误", "格式错误")
             return
 
-        success, msg = delete_port_exclusion(start, end)
+        try:
+            success, msg = self.ops.delete_port_exclusion(start, end)
+        except (HelperError, OSError) as e:
+            self.ops_failed(e)
+            return
         self.show_result(success, msg)
 
         if success:
@@ -395,6 +546,98 @@ class PortManagerApp:
                 save_config(self.config)
             self.refresh_all()
 
+    def reclaim_protection(self):
+        """停止 winnat 后添加端口保护，用于回收被 Hyper-V 占用的端口"""
+        port_str = self.protect_port_var.get().strip()
+        if not port_str:
+            messagebox.showerror("错误", "请输入端口号")
+            return
+
+        try:
+            if '-' in port_str:
+                start, end = map(int, port_str.split('-'))
+            else:
+                start = end = int(port_str)
+        except ValueError:
+            messagebox.showerror("错误", "格式错误，请输入如 3000 或 3000-3010")
+            return
+
+        if not messagebox.askyesno("确认", f"将临时停止 winnat 服务以保护端口 {start}-{end}，\n期间 WSL/Hyper-V 网络会短暂中断，是否继续？"):
+            return
+
+        self.show_status("正在重启 winnat...")
+
+        def do_reclaim():
+            try:
+                success, msg, _ = self.ops.reclaim_ports([("add", start, end)])
+            except (HelperError, OSError) as e:
+                self.root.after(0, lambda e=e: self.ops_failed(e))
+                return
+            if success and [start, end] not in self.config["protected_ports"]:
+                self.config["protected_ports"].append([start, end])
+                save_config(self.config)
+            self.root.after(0, lambda: self.show_result(success, msg))
+            self.root.after(0, self.refresh_all)
+
+        threading.Thread(target=do_reclaim, daemon=True).start()
+
+    def scan_projects(self):
+        """扫描项目目录中声明的端口，并可一键添加保护"""
+        root_dir = filedialog.askdirectory(title="选择要扫描的项目目录")
+        if not root_dir:
+            return
+
+        self.show_status("正在扫描项目端口...")
+
+        def do_scan():
+            result = scan_workspace(root_dir)
+            self.root.after(0, lambda: self.apply_scan_result(result))
+
+        threading.Thread(target=do_scan, daemon=True).start()
+
+    def apply_scan_result(self, result):
+        """显示扫描结果，确认后添加端口保护并写入配置"""
+        if result.get('error'):
+            self.show_status(f"扫描失败: {result['error']}", error=True)
+            return
+
+        ranges = result['ranges']
+        self.show_status(f"扫描完成，候选文件 {result['files']} 个")
+        if not ranges:
+            messagebox.showinfo("扫描结果", "未发现项目声明的端口")
+            return
+
+        text = ", ".join(str(s) if s == e else f"{s}-{e}" for s, e in ranges[:20])
+        if len(ranges) > 20:
+            text += " ..."
+        if not messagebox.askyesno("扫描结果", f"发现 {len(ranges)} 个端口范围:\n{text}\n\n是否全部添加保护并写入配置？"):
+            return
+
+        # 一次往返批量添加
+        try:
+            results = self.ops.batch([("add_port_exclusion", [start, end]) for start, end in ranges])
+        except (HelperError, OSError) as e:
+            self.ops_failed(e)
+            return
+        failed = []
+        added = []
+        for port_range, result in zip(ranges, results):
+            if not result['ok']:
+                failed.append(result['error'])
+            elif not result['value'][0]:
+                failed.append(result['value'][1])
+            else:
+                added.append(port_range)
+
+        # 只把成功添加排除的范围写入配置
+        if merge_into_config(self.config, added):
+            save_config(self.config)
+        if failed:
+            self.show_result(False, "部分端口添加失败:\n" + "\n".join(failed[:10]))
+        else:
+            self.show_result(True, f"已保护 {len(ranges)} 个端口范围")
+        self.refresh_all()
+
     def check_single_port(self):
         """检测单个端口"""
         port_str = self.protect_port_var.get().strip()
@@ -408,11 +651,14 @@ class PortManagerApp:
             messagebox.showerror("错误", "请输入有效的端口号")
             return
 
+        service = lookup_service(port)
+        name = f"端口 {port} ({service})" if service else f"端口 {port}"
+
         available, msg = check_port_available(port)
         if available:
-            messagebox.showinfo("检测结果", f"端口 {port} 可用")
+            messagebox.showinfo("检测结果", f"{name} 可用")
         else:
-            messagebox.showwarning("检测结果", f"端口 {port} 不可用\n{msg}")
+            messagebox.showwarning("检测结果", f"{name} 不可用\n{msg}")
 
     def save_current_config(self):
         """保存当前配置"""
@@ -432,6 +678,15 @@ class PortManagerApp:
         color = "red" if error else "black"
         self.status_msg.config(text=msg, foreground=color)
 
+    def ops_failed(self, error):
+        """端口管理操作抛出异常时提示；助手断开时更新管理员状态"""
+        if isinstance(error, (HelperDisconnected, OSError)):
+            self.elevated = is_admin()
+            self.admin_label.config(text="✗ 管理员助手已断开", foreground="red")
+        prefix = "管理员助手调用失败" if isinstance(error, HelperError) else "操作失败"
+        self.show_status(prefix, error=True)
+        self.show_result(False, f"{prefix}: {error}")
+
     def show_result(self, success, msg):
         """显示操作结果"""
         if success:
@@ -441,17 +696,45 @@ class PortManagerApp:
 
 
 def main():
-    # 检查管理员权限
-    if not is_admin():
-        if messagebox.askyesno("需要管理员权限", "此工具需要管理员权限才能修改系统设置。\n是否以管理员身份重新运行？"):
-            run_as_admin()
-        else:
-            messagebox.showwarning("警告", "部分功能可能无法使用")
+    args = sys.argv[1:]
+
+    # --record <文件>: 录制执行的所有命令及原始输出，可用 cmd_trace.py 离线回放
+    recorder = None
+    helper_args = []
+    if "--record" in args and args.index("--record") + 1 < len(args):
+        i = args.index("--record")
+        trace_path = args[i + 1]
+        del args[i:i + 2]
+        recorder = start_recording(trace_path)
+        helper_args = ["--record", trace_path + ".helper"]
+
+    try:
+        # 作为管理员助手进程运行: --helper <前端端口> <令牌>
+        if len(args) >= 3 and args[0] == "--helper":
+            run_helper(int(args[1]), args[2])
+            return
+
+        # 检查管理员权限
+        ops = LocalOperations()
+        if not is_admin():
+            if messagebox.askyesno("需要管理员权限", "此工具需要管理员权限才能修改系统设置。\n是否启动管理员助手？"):
+                client, err = start_elevated_helper(extra_args=helper_args)
+                if client:
+                    ops = HelperOperations(client)
+                else:
+                    messagebox.showwarning("警告", f"{err}\n部分功能可能无法使用")
+            else:
+                messagebox.showwarning("警告", "部分功能可能无法使用")
 
-    root = tk.Tk()
-    app = PortManagerApp(root)
-    root.mainloop()
+        root = tk.Tk()
+        app = PortManagerApp(root, ops)
+        root.mainloop()
+    finally:
+        if recorder:
+            stop_recording(recorder)
 
 
 if __name__ == "__main__":
+    # 打包后进程池的子进程需要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,202 @@
+"""
+全端口热力图
+把 0-65535 端口按行优先排成 256x256 的图像，在 Tk 画布上整体绘制，支持缩放和悬停查看
+"""
+import tkinter as tk
+from tkinter import ttk
+from bisect import bisect_right
+
+SIDE = 256
+ZOOM_LEVELS = (1, 2, 3, 4)
+
+# 端口分类，数值越大绘制优先级越高
+FREE = 0
+DYNAMIC = 1
+SYSTEM = 2
+ADMIN = 3
+PROTECTED = 4
+LISTENER = 5
+
+COLORS = {
+    FREE: (236, 240, 241),
+    DYNAMIC: (133, 193, 233),
+    SYSTEM: (231, 76, 60),
+    ADMIN: (243, 156, 18),
+    PROTECTED: (39, 174, 96),
+    LISTENER: (142, 68, 173),
+}
+LABELS = {
+    FREE: "空闲",
+    DYNAMIC: "动态端口范围",
+    SYSTEM: "系统预留",
+    ADMIN: "管理员排除",
+    PROTECTED: "配置中的保护端口",
+    LISTENER: "WSL 监听",
+}
+
+_RED = bytes(COLORS.get(i, (0, 0, 0))[0] for i in range(256))
+_GREEN = bytes(COLORS.get(i, (0, 0, 0))[1] for i in range(256))
+_BLUE = bytes(COLORS.get(i, (0, 0, 0))[2] for i in range(256))
+PPM_HEADER = b"P6 %d %d 255\n" % (SIDE, SIDE)
+
+
+def classify_ports(dynamic_range=None, exclusions=(), protected=(), listeners=()):
+    """生成每个端口一个字节的分类表，整段切片赋值，不逐端口循环"""
+    classes = bytearray(65536)
+
+    def fill(start, end, value):
+        start = max(0, start)
+        end = min(65535, end)
+        if start <= end:
+            classes[start:end + 1] = bytes((value,)) * (end - start + 1)
+
+    if dynamic_range:
+        fill(dynamic_range['start'], dynamic_range['start'] + dynamic_range['count'] - 1, DYNAMIC)
+    for item in exclusions:
+        fill(item['start'], item['end'], ADMIN if item['is_admin'] else SYSTEM)
+    for start, end in protected:
+        fill(start, end, PROTECTED)
+    for port in listeners:
+        classes[port] = LISTENER
+    return classes
+
+
+def render_ppm(classes):
+    """按调色板把分类表转换为二进制 PPM 图像数据"""
+    pixels = bytearray(len(classes) * 3)
+    pixels[0::3] = classes.translate(_RED)
+    pixels[1::3] = classes.translate(_GREEN)
+    pixels[2::3] = classes.translate(_BLUE)
+    return PPM_HEADER + pixels
+
+
+class RangeIndex:
+    """按起始端口排序的区间表，用于悬停时查找端口所在的范围"""
+
+    def __init__(self, dynamic_range=None, exclusions=(), protected=()):
+        layers = []
+        layers.append(sorted((item['start'], item['end'],
+                              ADMIN if item['is_admin'] else SYSTEM) for item in exclusions))
+        layers.append(sorted((start, end, PROTECTED) for start, end in protected))
+        if dynamic_range:
+            start = dynamic_range['start']
+            layers.append([(start, start + dynamic_range['count'] - 1, DYNAMIC)])
+        self.layers = []
+        for layer in layers:
+            # max_ends[i] 为前 i + 1 个范围的最大结束端口，向前查找时据此提前停止
+            max_ends = []
+            for item in layer:
+                max_ends.append(max(item[1], max_ends[-1]) if max_ends else item[1])
+            self.layers.append((layer, [item[0] for item in layer], max_ends))
+
+    def lookup(self, port):
+        """返回覆盖 port 的所有范围 [(start, end, 分类)]"""
+        found = []
+        for layer, starts, max_ends in self.layers:
+            # 配置中的保护端口可能互相重叠，需要检查所有起点不大于 port 的项；
+            # 排除和动态范围互不重叠，只需检查起点最近的一项
+            i = bisect_right(starts, port) - 1
+            while i >= 0 and max_ends[i] >= port:
+                start, end, kind = layer[i]
+                if end >= port:
+                    found.append((start, end, kind))
+                if kind != PROTECTED:
+                    break
+                i -= 1
+        return found
+
+
+class PortHeatmap(ttk.Frame):
+    """端口热力图面板"""
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.zoom = 1
+        self.classes = bytearray(65536)
+        self.index = RangeIndex()
+        self._base = None
+        self._image = None
+
+        toolbar = ttk.Frame(self)
+        toolbar.pack(fill=tk.X, pady=(0, 4))
+        ttk.Button(toolbar, text="放大", width=6, command=lambda: self.set_zoom(self.zoom + 1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="缩小", width=6, command=lambda: self.set_zoom(self.zoom - 1)).pack(side=tk.LEFT, padx=2)
+        self.info_label = ttk.Label(toolbar, text="每行 256 个端口，移动鼠标查看详情")
+        self.info_label.pack(side=tk.LEFT, padx=8)
+
+        canvas_frame = ttk.Frame(self)
+        canvas_frame.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(canvas_frame, width=SIDE, height=SIDE, highlightthickness=0, background="white")
+        xscroll = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        yscroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(xscrollcommand=xscroll.set, yscrollcommand=yscroll.set)
+        yscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        xscroll.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._item = self.canvas.create_image(0, 0, anchor=tk.NW)
+
+        self.canvas.bind("<Motion>", self.on_motion)
+        self.canvas.bind("<Leave>", lambda e: self.info_label.config(text=""))
+        self.canvas.bind("<Control-MouseWheel>", self.on_wheel)
+
+        legend = ttk.Frame(self)
+        legend.pack(fill=tk.X, pady=(4, 0))
+        for kind in (DYNAMIC, SYSTEM, ADMIN, PROTECTED, LISTENER):
+            color = "#%02x%02x%02x" % COLORS[kind]
+            tk.Label(legend, background=color, width=2).pack(side=tk.LEFT, padx=(6, 2))
+            ttk.Label(legend, text=LABELS[kind]).pack(side=tk.LEFT)
+
+        self.redraw()
+
+    def update_snapshot(self, dynamic_range=None, exclusions=(), protected=(), listeners=()):
+        """快照变化时重新生成分类表并重绘"""
+        self.classes = classify_ports(dynamic_range, exclusions, protected, listeners)
+        self.index = RangeIndex(dynamic_range, exclusions, protected)
+        self.redraw()
+
+    def redraw(self):
+        """整体生成图像后一次性放到画布上"""
+        self._base = tk.PhotoImage(data=render_ppm(self.classes), format="PPM")
+        self._image = self._base.zoom(self.zoom) if self.zoom > 1 else self._base
+        self.canvas.itemconfigure(self._item, image=self._image)
+        size = SIDE * self.zoom
+        self.canvas.configure(scrollregion=(0, 0, size, size))
+
+    def set_zoom(self, zoom):
+        """切换缩放倍数，只重新缩放已生成的图像"""
+        zoom = min(max(zoom, ZOOM_LEVELS[0]), ZOOM_LEVELS[-1])
+        if zoom == self.zoom:
+            return
+        self.zoom = zoom
+        self._image = self._base.zoom(zoom) if zoom > 1 else self._base
+        self.canvas.itemconfigure(self._item, image=self._image)
+        size = SIDE * zoom
+        self.canvas.configure(scrollregion=(0, 0, size, size))
+
+    def on_wheel(self, event):
+        self.set_zoom(self.zoom + (1 if event.delta > 0 else -1))
+
+    def port_at(self, x, y):
+        """画布坐标转换为端口号，超出图像时返回 None"""
+        col = int(self.canvas.canvasx(x)) // self.zoom
+        row = int(self.canvas.canvasy(y)) // self.zoom
+        if 0 <= col < SIDE and 0 <= row < SIDE:
+            return row * SIDE + col
+        return None
+
+    def on_motion(self, event):
+        port = self.port_at(event.x, event.y)
+        if port is None:
+            self.info_label.config(text="")
+            return
+        own = []
+        parts = []
+        for start, end, kind in self.index.lookup(port):
+            if kind != self.classes[port]:
+                parts.append(f"{LABELS[kind]} {start}-{end}")
+            else:
+                own.append(f"{start}-{end}")
+        head = f"端口 {port}: {LABELS[self.classes[port]]}"
+        if own:
+            head += " " + "、".join(own)
+        self.info_label.config(text="，".join([head] + parts))
@@ -2,12 +2,16 @@
 Windows 端口预留管理工具
 管理 Hyper-V 和 WSL 的端口预留
 """
+import functools
 import subprocess
 import re
 import random
 import ctypes
 import sys
 
+# dism 成功但需要重启时的退出码
+ERROR_SUCCESS_REBOOT_REQUIRED = 3010
+
 
 def is_admin():
     """检查是否以管理员权限运行"""
@@ -26,25 +30,112 @@ def run_as_admin():
         sys.exit()
 
 
+def subprocess_backend(cmd, shell=True):
+    """默认命令后端：真实执行命令，返回原始字节输出"""
+    result = subprocess.run(cmd, shell=shell, capture_output=True)
+    return result.stdout, result.stderr, result.returncode
+
+
+_backend = subprocess_backend
+
+
+def set_command_backend(backend=None):
+    """
+    替换命令执行后端，返回之前的后端
+
+    backend(cmd, shell) -> (stdout, stderr, returncode)，输出可以是 bytes 或 str；
+    传入 None 恢复为真实执行
+    """
+    global _backend
+    previous = _backend
+    _backend = backend or subprocess_backend
+    return previous
+
+
+def get_command_backend():
+    """获取当前命令执行后端"""
+    return _backend
+
+
+def decode_output(data):
+    """按系统代码页解码命令输出，并统一换行符"""
+    if isinstance(data, bytes):
+        data = data.decode('gbk', errors='ignore')
+    return data.replace('\r\n', '\n')
+
+
 def run_cmd(cmd, shell=True):
     """执行命令并返回输出"""
     try:
-        result = subprocess.run(
-            cmd,
-            shell=shell,
-            capture_output=True,
-            text=True,
-            encoding='gbk',
-            errors='ignore'
-        )
-        return result.stdout, result.stderr, result.returncode
+        stdout, stderr, code = _backend(cmd, shell)
+        return decode_output(stdout), decode_output(stderr), code
     except Exception as e:
         return "", str(e), 1
 
 
+_mutation_listeners = []
+# 修改后是否直接让跨进程共享的快照失效；管理员助手中关闭，由前端进程代为处理
+_invalidate_shared_cache = True
+
+
+def add_mutation_listener(callback):
+    """注册回调，在修改系统端口/功能设置成功后调用 callback(操作名)"""
+    if callback not in _mutation_listeners:
+        _mutation_listeners.append(callback)
+
+
+def remove_mutation_listener(callback):
+    """取消注册修改回调"""
+    if callback in _mutation_listeners:
+        _mutation_listeners.remove(callback)
+
+
+def set_shared_cache_invalidation(enabled):
+    """设置修改后是否直接让共享快照文件失效"""
+    global _invalidate_shared_cache
+    _invalidate_shared_cache = enabled
+
+
+def notify_mutation(name):
+    """通知所有监听者设置已被修改，并让共享快照失效（即使本进程没有打开缓存）"""
+    if _invalidate_shared_cache:
+        try:
+            from snapshot_cache import invalidate_shared_cache
+            invalidate_shared_cache()
+        except Exception:
+            pass
+    for callback in list(_mutation_listeners):
+        try:
+            callback(name)
+        except Exception:
+            pass
+
+
+def command_operation(func):
+    """
+    把生成器形式的操作包装为同步函数
+
+    操作通过 yield 命令获得 (stdout, stderr, returncode)，最后 return 结果；
+    同步包装用 run_cmd 逐条执行，原始生成器保存在 .operation 上供异步版本驱动
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        gen = func(*args, **kwargs)
+        try:
+            cmd = next(gen)
+            while True:
+                cmd = gen.send(run_cmd(cmd))
+        except StopIteration as e:
+            return e.value
+
+    wrapper.operation = func
+    return wrapper
+
+
+@command_operation
 def get_excluded_ports():
     """获取当前被预留的端口列表"""
-    stdout, stderr, code = run_cmd("netsh interface ipv4 show excludedportrange protocol=tcp")
+    stdout, stderr, code = yield "netsh interface ipv4 show excludedportrange protocol=tcp"
 
     ports = []
     if code == 0:
@@ -67,9 +158,10 @@ def get_excluded_ports():
     return ports, stderr if code != 0 else None
 
 
+@command_operation
 def get_dynamic_port_range():
     """获取当前动态端口范围设置"""
-    stdout, stderr, code = run_cmd("netsh interface ipv4 show dynamicport tcp")
+    stdout, stderr, code = yield "netsh interface ipv4 show dynamicport tcp"
 
     if code == 0:
         # 解析起始端口和数量
@@ -90,6 +182,7 @@ def get_dynamic_port_range():
     return None, stderr
 
 
+@command_operation
 def set_dynamic_port_range(start, count):
     """设置动态端口范围（需要重启生效）"""
     if start < 1025 or start > 65535:
@@ -100,13 +193,15 @@ def set_dynamic_port_range(start, count):
         return False, f"端口范围超出上限，最大结束端口为 {start + count - 1}"
 
     cmd = f"netsh interface ipv4 set dynamic tcp start={start} num={count}"
-    stdout, stderr, code = run_cmd(cmd)
+    stdout, stderr, code = yield cmd
 
     if code == 0:
+        notify_mutation("set_dynamic_port_range")
         return True, "设置成功，需要重启电脑生效"
-    return False, stderr or "设置失败"
+    return False, stderr or stdout or "设置失败"
 
 
+@command_operation
 def add_port_exclusion(start, end=None):
     """添加管理员端口排除（立即生效）"""
     if end is None:
@@ -117,18 +212,21 @@ def add_port_exclusion(start, end=None):
 
     count = end - start + 1
     cmd = f"netsh interface ipv4 add excludedportrange protocol=tcp startport={start} numberofports={count}"
-    stdout, stderr, code = run_cmd(cmd)
+    stdout, stderr, code = yield cmd
 
     if code == 0:
+        notify_mutation("add_port_exclusion")
         return True, f"已保护端口 {start}-{end}"
 
-    # 检查是否端口已被占用
-    if "denied" in stderr.lower() or "拒绝" in stderr:
+    # 检查是否端口已被占用（netsh 的错误信息输出在 stdout）
+    error = stderr or stdout
+    if any(key in error.lower() for key in ("denied", "拒绝", "being used", "正在使用")):
         return False, f"端口 {start}-{end} 已被占用，无法排除"
 
-    return False, stderr or "添加失败"
+    return False, error or "添加失败"
 
 
+@command_operation
 def delete_port_exclusion(start, end=None):
     """删除管理员端口排除"""
     if end is None:
@@ -136,11 +234,12 @@ def delete_port_exclusion(start, end=None):
 
     count = end - start + 1
     cmd = f"netsh interface ipv4 delete excludedportrange protocol=tcp startport={start} numberofports={count}"
-    stdout, stderr, code = run_cmd(cmd)
+    stdout, stderr, code = yield cmd
 
     if code == 0:
+        notify_mutation("delete_port_exclusion")
         return True, f"已删除端口保护 {start}-{end}"
-    return False, stderr or "删除失败（可能不是管理员排除的端口）"
+    return False, stderr or stdout or "删除失败（可能不是管理员排除的端口）"
 
 
 def check_port_available(port):
@@ -164,9 +263,10 @@ def check_ports_in_range(start, end):
     return occupied
 
 
+@command_operation
 def get_hyperv_status():
     """获取 Hyper-V 状态"""
-    stdout, stderr, code = run_cmd("dism /online /get-featureinfo /featurename:Microsoft-Hyper-V-All")
+    stdout, stderr, code = yield "dism /online /get-featureinfo /featurename:Microsoft-Hyper-V-All"
 
     if "enabled" in stdout.lower() or "启用" in stdout:
         return True, "已启用"
@@ -174,27 +274,30 @@ def get_hyperv_status():
         return False, "已禁用"
     else:
         # 尝试另一种检测方式
-        stdout2, _, _ = run_cmd("sc query vmms")
+        stdout2, _, _ = yield "sc query vmms"
         if "RUNNING" in stdout2:
             return True, "已启用"
         return False, "未安装或已禁用"
 
 
+@command_operation
 def set_hyperv(enable):
     """开启或关闭 Hyper-V（需要重启）"""
     action = "Enable" if enable else "Disable"
     cmd = f"dism /online /{action}-Feature /FeatureName:Microsoft-Hyper-V-All /NoRestart"
-    stdout, stderr, code = run_cmd(cmd)
+    stdout, stderr, code = yield cmd
 
-    if code == 0:
+    if code in (0, ERROR_SUCCESS_REBOOT_REQUIRED):
+        notify_mutation("set_hyperv")
         status = "启用" if enable else "禁用"
         return True, f"Hyper-V 已{status}，需要重启电脑生效"
     return False, stderr or stdout or "操作失败"
 
 
+@command_operation
 def get_wsl_status():
     """获取 WSL 状态"""
-    stdout, stderr, code = run_cmd("dism /online /get-featureinfo /featurename:Microsoft-Windows-Subsystem-Linux")
+    stdout, stderr, code = yield "dism /online /get-featureinfo /featurename:Microsoft-Windows-Subsystem-Linux"
 
     if "enabled" in stdout.lower() or "启用" in stdout:
         return True, "已启用"
@@ -203,13 +306,15 @@ def get_wsl_status():
     return None, "无法检测"
 
 
+@command_operation
 def set_wsl(enable):
     """开启或关闭 WSL（需要重启）"""
     action = "Enable" if enable else "Disable"
     cmd = f"dism /online /{action}-Feature /FeatureName:Microsoft-Windows-Subsystem-Linux /NoRestart"
-    stdout, stderr, code = run_cmd(cmd)
+    stdout, stderr, code = yield cmd
 
-    if code == 0:
+    if code in (0, ERROR_SUCCESS_REBOOT_REQUIRED):
+        notify_mutation("set_wsl")
         status = "启用" if enable else "禁用"
         return True, f"WSL 已{status}，需要重启电脑生效"
     return False, stderr or stdout or "操作失败"
@@ -0,0 +1,159 @@
+"""
+常用端口服务名查询
+服务表由 port_services.csv 编译为按端口索引的紧凑二进制文件 port_services.bin，
+首次查询时通过内存映射延迟加载，查询为 O(1) 且不为每个条目创建 Python 对象
+
+文件格式（小端）:
+    头部    magic "PSRV", version u32, 条目数 N u32, 保留 u32
+    索引    65536 x u16，值为条目序号 + 1，0 表示未登记
+    端口    N x u16，升序
+    偏移    (N + 1) x u32，服务名在名称区中的起止位置
+    名称区  UTF-8 字符串拼接
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+
+SOURCE_FILE = "port_services.csv"
+DATA_FILE = "port_services.bin"
+
+MAGIC = b"PSRV"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+INDEX_SIZE = 65536 * 2
+
+
+def get_data_dir():
+    """获取数据文件所在目录（打包后为解压目录）"""
+    return getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+
+
+def compile_registry(source=None, target=None):
+    """把 CSV 服务表编译为二进制文件，返回条目数"""
+    data_dir = os.path.dirname(os.path.abspath(__file__))
+    source = source or os.path.join(data_dir, SOURCE_FILE)
+    target = target or os.path.join(data_dir, DATA_FILE)
+
+    services = {}
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            port, name = line.split(",", 1)
+            port = int(port)
+            if not 0 <= port <= 65535:
+                raise ValueError(f"端口超出范围: {port}")
+            services[port] = name.strip()
+
+    ports = sorted(services)
+    index = [0] * 65536
+    offsets = [0]
+    names = bytearray()
+    for i, port in enumerate(ports):
+        index[port] = i + 1
+        names += services[port].encode("utf-8")
+        offsets.append(len(names))
+
+    with open(target, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(ports), 0))
+        f.write(struct.pack(f"<{65536}H", *index))
+        f.write(struct.pack(f"<{len(ports)}H", *ports))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(names)
+    return len(ports)
+
+
+class PortRegistry:
+    """内存映射的服务表"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("服务表文件格式不正确")
+
+        view = memoryview(self._mm)
+        ports_at = HEADER.size + INDEX_SIZE
+        offsets_at = ports_at + count * 2
+        self._names_at = offsets_at + (count + 1) * 4
+        if sys.byteorder == "little":
+            # 直接在映射内存上按 u16/u32 访问，不复制
+            self._index = view[HEADER.size:ports_at].cast("H")
+            self._ports = view[ports_at:offsets_at].cast("H")
+            self._offsets = view[offsets_at:self._names_at].cast("I")
+        else:
+            import array
+            self._index = array.array("H", view[HEADER.size:ports_at])
+            self._ports = array.array("H", view[ports_at:offsets_at])
+            self._offsets = array.array("I", view[offsets_at:self._names_at])
+            for table in (self._index, self._ports, self._offsets):
+                table.byteswap()
+        self.count = count
+
+    def _name(self, i):
+        start = self._names_at + self._offsets[i]
+        end = self._names_at + self._offsets[i + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def lookup(self, port):
+        """返回端口的服务名，未登记返回 None"""
+        if not 0 <= port <= 65535:
+            return None
+        i = self._index[port]
+        return self._name(i - 1) if i else None
+
+    def services_in_range(self, start, end):
+        """返回 [start, end] 内登记的 [(端口, 服务名)]"""
+        lo = bisect_left(self._ports, start)
+        hi = bisect_right(self._ports, end)
+        return [(self._ports[i], self._name(i)) for i in range(lo, hi)]
+
+
+_registry = None
+_registry_failed = False
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """首次调用时加载服务表，文件缺失或损坏时返回 None"""
+    global _registry, _registry_failed
+    if _registry is None and not _registry_failed:
+        with _registry_lock:
+            if _registry is None and not _registry_failed:
+                try:
+                    _registry = PortRegistry(os.path.join(get_data_dir(), DATA_FILE))
+                except (OSError, ValueError, struct.error):
+                    _registry_failed = True
+    return _registry
+
+
+def lookup_service(port):
+    """查询端口对应的服务名"""
+    registry = get_registry()
+    return registry.lookup(port) if registry else None
+
+
+def services_in_range(start, end):
+    """查询范围内登记的服务"""
+    registry = get_registry()
+    return registry.services_in_range(start, end) if registry else []
+
+
+def describe_range(start, end, limit=3):
+    """生成范围内服务的简短描述，如 'MySQL(3306), Redis(6379) 等 5 个'"""
+    services = services_in_range(start, end)
+    if not services:
+        return ""
+    text = ", ".join(f"{name}({port})" for port, name in services[:limit])
+    if len(services) > limit:
+        text += f" 等 {len(services)} 个"
+    return text
+
+
+if __name__ == "__main__":
+    print(f"已编译 {compile_registry()} 个服务到 {DATA_FILE}")
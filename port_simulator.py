@@ -0,0 +1,359 @@
+"""
+Windows 端口预留协议栈的内存模拟器
+模拟 netsh / dism / sc / net 命令的行为和输出格式，可作为 port_manager 的命令后端，
+用于在非 Windows 环境下运行和压测端口管理逻辑
+"""
+import random
+import threading
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+
+from port_manager import set_command_backend
+
+HYPERV_FEATURE = "microsoft-hyper-v-all"
+WSL_FEATURE = "microsoft-windows-subsystem-linux"
+
+FEATURE_INFO = {
+    HYPERV_FEATURE: ("Microsoft-Hyper-V-All", "Hyper-V",
+                     "Hyper-V Management Tools and Hyper-V Platform."),
+    WSL_FEATURE: ("Microsoft-Windows-Subsystem-Linux", "Windows Subsystem for Linux",
+                  "Provides services and environments for running native user-mode Linux shells and tools on Windows."),
+}
+
+# 命令退出码
+ERROR_ACCESS_DENIED = 5
+ERROR_ELEVATION_REQUIRED = 740
+ERROR_SUCCESS_REBOOT_REQUIRED = 3010
+ERROR_SERVICE_DOES_NOT_EXIST = 1060
+ERROR_SERVICE_ALREADY_RUNNING = 2
+ERROR_FEATURE_UNKNOWN = 0x800F080C
+
+MSG_IN_USE = "The process cannot access the file because it is being used by another process.\n"
+MSG_NOT_FOUND = "Element not found.\n"
+MSG_BAD_PARAM = "The parameter is incorrect.\n"
+MSG_ELEVATION = "The requested operation requires elevation (Run as administrator).\n"
+MSG_OK = "Ok.\n"
+
+DISM_HEADER = (
+    "\nDeployment Image Servicing and Management tool\n"
+    "Version: 10.0.19041.3636\n\n"
+    "Image Version: 10.0.19045.4046\n\n"
+)
+DISM_ELEVATION = (
+    "\nError: 740\n\n"
+    "Elevated permissions are required to run DISM.\n"
+    "Use an elevated command prompt to complete these tasks.\n"
+)
+
+
+class PortStackSimulator:
+    """
+    模拟端口排除表、动态端口范围、可选功能和服务状态
+
+    - 排除表按起始端口有序保存，重叠添加会被拒绝
+    - winnat 启动时在生效的动态端口范围内随机预留端口块（系统预留）
+    - 动态端口范围和功能开关要调用 reboot() 后才真正生效
+    - 实例可直接作为 set_command_backend() 的后端
+    """
+
+    def __init__(self, dynamic_start=49152, dynamic_count=16384, hyperv=True, wsl=True,
+                 elevated=True, reserved_blocks=5, block_size=100, seed=0):
+        self.elevated = elevated
+        self.reserved_blocks = reserved_blocks
+        self.block_size = block_size
+        self.dynamic = (dynamic_start, dynamic_count)
+        self.active_dynamic = self.dynamic
+        self.features = {
+            HYPERV_FEATURE: "Enabled" if hyperv else "Disabled",
+            WSL_FEATURE: "Enabled" if wsl else "Disabled",
+        }
+        self.pending_features = {}
+        self.services = {"winnat": False, "vmms": hyperv}
+        self.calls = 0
+
+        self._starts = []
+        self._ends = []
+        self._admin = []
+        self._bound = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._start_winnat()
+
+    # ===== 状态操作 =====
+
+    def exclusions(self):
+        """返回当前排除表 [(start, end, is_admin)]"""
+        return list(zip(self._starts, self._ends, self._admin))
+
+    def bind(self, port):
+        """模拟有程序监听该端口，排除覆盖它时会失败"""
+        insort(self._bound, port)
+
+    def reboot(self):
+        """模拟重启：应用待生效的功能和动态端口范围，重新生成系统预留"""
+        with self._lock:
+            for feature, state in self.pending_features.items():
+                self.features[feature] = "Enabled" if state == "Enable Pending" else "Disabled"
+            self.pending_features.clear()
+            self.active_dynamic = self.dynamic
+            self.services["vmms"] = self.features[HYPERV_FEATURE] == "Enabled"
+            self._bound.clear()
+            self.services["winnat"] = False
+            self._release_system_ranges()
+            self._start_winnat()
+
+    def _overlaps(self, start, end):
+        i = bisect_right(self._starts, end) - 1
+        return i >= 0 and self._ends[i] >= start
+
+    def _port_bound(self, start, end):
+        i = bisect_right(self._bound, end) - 1
+        return i >= 0 and self._bound[i] >= start
+
+    def _insert(self, start, end, is_admin):
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._admin.insert(i, is_admin)
+
+    def _remove(self, i):
+        del self._starts[i]
+        del self._ends[i]
+        del self._admin[i]
+
+    def _release_system_ranges(self):
+        keep = [(s, e, a) for s, e, a in self.exclusions() if a]
+        self._starts = [s for s, _, _ in keep]
+        self._ends = [e for _, e, _ in keep]
+        self._admin = [True] * len(keep)
+
+    def _start_winnat(self):
+        """启动 winnat，Hyper-V 或 WSL 生效时在动态范围内预留端口块"""
+        self.services["winnat"] = True
+        if self.features[HYPERV_FEATURE] != "Enabled" and self.features[WSL_FEATURE] != "Enabled":
+            return
+        start, count = self.active_dynamic
+        last = start + count - self.block_size
+        placed = 0
+        for _ in range(self.reserved_blocks * 20):
+            if placed >= self.reserved_blocks or last < start:
+                break
+            block_start = self._rng.randint(start, last)
+            block_end = block_start + self.block_size - 1
+            if self._overlaps(block_start, block_end):
+                continue
+            self._insert(block_start, block_end, False)
+            placed += 1
+
+    # ===== 命令分发 =====
+
+    def __call__(self, cmd, shell=True):
+        tokens = (cmd if isinstance(cmd, str) else " ".join(cmd)).lower().split()
+        with self._lock:
+            self.calls += 1
+            if not tokens:
+                return "", "", 0
+            handler = self._handlers.get(tokens[0])
+            if handler is None:
+                return "", (f"'{tokens[0]}' is not recognized as an internal or external command,\n"
+                            "operable program or batch file.\n"), 1
+            return handler(self, tokens)
+
+    def _netsh(self, tokens):
+        if len(tokens) < 5 or tokens[1] != "interface" or tokens[2] not in ("ipv4", "ip"):
+            return "The following command was not found: " + " ".join(tokens[1:]) + ".\n", "", 1
+        verb, noun = tokens[3], tokens[4]
+        args = dict(t.split("=", 1) for t in tokens[5:] if "=" in t)
+
+        if verb == "show" and noun.startswith("excludedportrange"):
+            return self._show_excluded(), "", 0
+        if verb == "show" and noun.startswith("dynamicport"):
+            return self._show_dynamic(), "", 0
+        if verb in ("set", "add", "delete") and not self.elevated:
+            return MSG_ELEVATION, "", 1
+        try:
+            if verb == "set" and noun.startswith("dynamic"):
+                return self._set_dynamic(int(args["start"]), int(args["num"]))
+            if verb == "add" and noun.startswith("excludedportrange"):
+                return self._add_excluded(int(args["startport"]), int(args["numberofports"]))
+            if verb == "delete" and noun.startswith("excludedportrange"):
+                return self._delete_excluded(int(args["startport"]), int(args["numberofports"]))
+        except (KeyError, ValueError):
+            return MSG_BAD_PARAM, "", 1
+        return "The following command was not found: " + " ".join(tokens[1:]) + ".\n", "", 1
+
+    def _show_excluded(self):
+        lines = [
+            "",
+            "Protocol tcp Port Exclusion Ranges",
+            "",
+            "Start Port    End Port",
+            "----------    --------",
+        ]
+        for start, end, is_admin in zip(self._starts, self._ends, self._admin):
+            lines.append(f"{start:>10}  {end:>10}     *" if is_admin else f"{start:>10}  {end:>10}")
+        lines += ["", "* - Administered port exclusions.", "", ""]
+        return "\n".join(lines)
+
+    def _show_dynamic(self):
+        start, count = self.dynamic
+        return (
+            "\nProtocol tcp Dynamic Port Range\n"
+            "---------------------------------\n"
+            f"Start Port      : {start}\n"
+            f"Number of Ports : {count}\n\n"
+        )
+
+    def _set_dynamic(self, start, count):
+        if start < 1025 or count < 255 or start + count > 65536:
+            return MSG_BAD_PARAM, "", 1
+        self.dynamic = (start, count)
+        return MSG_OK, "", 0
+
+    def _add_excluded(self, start, count):
+        end = start + count - 1
+        if start < 1 or count < 1 or end > 65535:
+            return MSG_BAD_PARAM, "", 1
+        if self._overlaps(start, end) or self._port_bound(start, end):
+            return MSG_IN_USE, "", 1
+        self._insert(start, end, True)
+        return MSG_OK, "", 0
+
+    def _delete_excluded(self, start, count):
+        end = start + count - 1
+        i = bisect_right(self._starts, start) - 1
+        if i < 0 or self._starts[i] != start or self._ends[i] != end:
+            return MSG_NOT_FOUND, "", 1
+        if not self._admin[i]:
+            return "Access is denied.\n", "", 1
+        self._remove(i)
+        return MSG_OK, "", 0
+
+    def _dism(self, tokens):
+        if not self.elevated:
+            return DISM_ELEVATION, "", ERROR_ELEVATION_REQUIRED
+        args = {}
+        action = None
+        for t in tokens[1:]:
+            if not t.startswith("/"):
+                continue
+            key, _, value = t[1:].partition(":")
+            if key in ("get-featureinfo", "enable-feature", "disable-feature"):
+                action = key
+            args[key] = value
+
+        feature = args.get("featurename", "")
+        if action is None or feature not in self.features:
+            return (DISM_HEADER + f"\nError: {ERROR_FEATURE_UNKNOWN:#x}\n\n"
+                    f"Feature name {feature} is unknown.\n"), "", ERROR_FEATURE_UNKNOWN
+
+        if action == "get-featureinfo":
+            name, display, description = FEATURE_INFO[feature]
+            state = self.pending_features.get(feature, self.features[feature])
+            return (DISM_HEADER + "Feature Information:\n\n"
+                    f"Feature Name : {name}\n"
+                    f"Display Name : {display}\n"
+                    f"Description : {description}\n"
+                    "Restart Required : Possible\n"
+                    f"State : {state}\n\n"
+                    "Custom Properties:\n\n(No custom properties found)\n\n"
+                    "The operation completed successfully.\n"), "", 0
+
+        enable = action == "enable-feature"
+        target = "Enabled" if enable else "Disabled"
+        progress = "Enabling feature(s)\n" if enable else "Disabling feature(s)\n"
+        if self.features[feature] == target:
+            self.pending_features.pop(feature, None)
+            return (DISM_HEADER + progress +
+                    "[==========================100.0%==========================]\n"
+                    "The operation completed successfully.\n"), "", 0
+        self.pending_features[feature] = "Enable Pending" if enable else "Disable Pending"
+        return (DISM_HEADER + progress +
+                "[==========================100.0%==========================]\n"
+                "The operation completed successfully.\n"
+                "Restart Windows to complete this operation.\n"
+                "Do you want to restart the computer now? (Y/N)\n"), "", ERROR_SUCCESS_REBOOT_REQUIRED
+
+    def _sc(self, tokens):
+        if len(tokens) < 3 or tokens[1] != "query":
+            return "DESCRIPTION:\n        SC is a command line program used for communicating with the\n", "", 1
+        name = tokens[2]
+        if name not in self.services:
+            return (f"[SC] EnumQueryServicesStatus:OpenService FAILED {ERROR_SERVICE_DOES_NOT_EXIST}:\n\n"
+                    "The specified service does not exist as an installed service.\n\n"), "", ERROR_SERVICE_DOES_NOT_EXIST
+        running = self.services[name]
+        state = "4  RUNNING" if running else "1  STOPPED"
+        return (f"\nSERVICE_NAME: {name}\n"
+                "        TYPE               : 1  KERNEL_DRIVER\n"
+                f"        STATE              : {state}\n"
+                "        WIN32_EXIT_CODE    : 0  (0x0)\n"
+                "        SERVICE_EXIT_CODE  : 0  (0x0)\n"
+                "        CHECKPOINT         : 0x0\n"
+                "        WAIT_HINT          : 0x0\n"), "", 0
+
+    def _net(self, tokens):
+        if len(tokens) < 3 or tokens[1] not in ("start", "stop"):
+            return "", "The syntax of this command is:\n\nNET\n", 1
+        name = tokens[2]
+        if not self.elevated:
+            return "", "System error 5 has occurred.\n\nAccess is denied.\n\n", ERROR_ACCESS_DENIED
+        if name not in self.services:
+            return "", "The service name is invalid.\n\nMore help is available by typing NET HELPMSG 2185.\n\n", 2
+
+        if tokens[1] == "stop":
+            if not self.services[name]:
+                return "", "The service has not been started.\n\nMore help is available by typing NET HELPMSG 3521.\n\n", 2
+            self.services[name] = False
+            if name == "winnat":
+                self._release_system_ranges()
+            return f"The {name} service was stopped successfully.\n\n", "", 0
+
+        if self.services[name]:
+            return "", "The requested service has already been started.\n\nMore help is available by typing NET HELPMSG 2182.\n\n", ERROR_SERVICE_ALREADY_RUNNING
+        if name == "winnat":
+            self._start_winnat()
+        else:
+            self.services[name] = True
+        return f"The {name} service was started successfully.\n\n", "", 0
+
+    _handlers = {
+        "netsh": _netsh,
+        "dism": _dism,
+        "sc": _sc,
+        "net": _net,
+    }
+
+
+@contextmanager
+def simulated(**kwargs):
+    """在 with 块内使用模拟器作为 port_manager 的命令后端"""
+    simulator = PortStackSimulator(**kwargs)
+    previous = set_command_backend(simulator)
+    try:
+        yield simulator
+    finally:
+        set_command_backend(previous)
+
+
+def _benchmark(operations=1000000):
+    """通过 port_manager 的公开函数驱动模拟器，统计吞吐量"""
+    import time
+    import port_manager
+
+    with simulated(seed=1) as sim:
+        rnd = random.Random(1)
+        start_time = time.perf_counter()
+        for n in range(operations):
+            start = rnd.randint(1024, 40000)
+            if n % 2:
+                port_manager.add_port_exclusion(start, start + rnd.randint(0, 9))
+            else:
+                port_manager.delete_port_exclusion(start, start)
+        elapsed = time.perf_counter() - start_time
+        ports, _ = port_manager.get_excluded_ports()
+    print(f"{operations} 次操作耗时 {elapsed:.2f} 秒 ({operations / elapsed:,.0f} ops/s)，"
+          f"排除表 {len(ports)} 项，命令 {sim.calls} 次")
+
+
+if __name__ == "__main__":
+    _benchmark()
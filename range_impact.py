@@ -0,0 +1,156 @@
+"""
+动态端口范围变更影响分析
+对新旧动态范围、监听端口、管理员排除、配置中的保护端口和常用服务端口做一次区间扫描，
+给出冲突列表、可用临时端口的净变化以及被释放的端口
+"""
+from port_registry import services_in_range
+
+NEW = "new"
+OLD = "old"
+EXCLUSION = "exclusion"
+PROTECTED = "protected"
+LISTENER = "listener"
+SERVICE = "service"
+
+CONFLICT_LABELS = {
+    LISTENER: "监听端口",
+    PROTECTED: "保护端口",
+    SERVICE: "常用服务",
+    EXCLUSION: "管理员排除",
+}
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def analyze_range_change(start, count, current=None, exclusions=(), listeners=(), protected=(), services=None):
+    """
+    分析把动态端口范围改为 [start, start + count - 1] 的影响
+
+    current: 当前动态范围 {'start', 'count'}
+    exclusions: get_excluded_ports() 的结果，只有管理员排除会在重启后保留
+    listeners: 正在监听的端口
+    protected: config 中的 protected_ports
+    services: [(端口, 服务名)]，默认取新范围内登记的常用服务
+
+    返回 {'start', 'end', 'conflicts', 'usable_new', 'usable_old', 'net_change', 'freed', 'freed_count'}
+    """
+    end = start + count - 1
+    if services is None:
+        services = services_in_range(start, end)
+
+    events = [(start, 1, NEW, None), (end + 1, -1, NEW, None)]
+    if current:
+        old_start = current['start']
+        old_end = old_start + current['count'] - 1
+        events += [(old_start, 1, OLD, None), (old_end + 1, -1, OLD, None)]
+    for item in exclusions:
+        if item['is_admin']:
+            payload = (item['start'], item['end'])
+            events += [(item['start'], 1, EXCLUSION, payload), (item['end'] + 1, -1, EXCLUSION, payload)]
+    for s, e in protected:
+        payload = (s, e)
+        events += [(s, 1, PROTECTED, payload), (e + 1, -1, PROTECTED, payload)]
+    for port in set(listeners):
+        events += [(port, 1, LISTENER, port), (port + 1, -1, LISTENER, port)]
+    for port, name in services:
+        payload = (port, name)
+        events += [(port, 1, SERVICE, payload), (port + 1, -1, SERVICE, payload)]
+    events.sort(key=lambda ev: ev[0])
+
+    depth = {NEW: 0, OLD: 0, EXCLUSION: 0}
+    active = {EXCLUSION: {}, PROTECTED: {}, LISTENER: {}, SERVICE: {}}
+    hits = {}
+    usable_new = usable_old = 0
+    freed = []
+
+    i = 0
+    prev = None
+    while i < len(events):
+        pos = events[i][0]
+        if prev is not None and pos > prev:
+            # 处理 [prev, pos - 1] 这一段，段内各类区间的覆盖状态不变
+            seg_end = pos - 1
+            size = pos - prev
+            excluded = depth[EXCLUSION] > 0
+            if depth[NEW] and not excluded:
+                usable_new += size
+            if depth[OLD] and not excluded:
+                usable_old += size
+            if depth[OLD] and not depth[NEW]:
+                freed.append((prev, seg_end))
+            if depth[NEW]:
+                for kind, payloads in active.items():
+                    for payload in payloads:
+                        key = (kind, payload)
+                        if key in hits:
+                            hits[key][1] = seg_end
+                        else:
+                            hits[key] = [prev, seg_end]
+        while i < len(events) and events[i][0] == pos:
+            _, delta, kind, payload = events[i]
+            if kind in depth:
+                depth[kind] += delta
+            if payload is not None:
+                counts = active[kind]
+                counts[payload] = counts.get(payload, 0) + delta
+                if not counts[payload]:
+                    del counts[payload]
+            i += 1
+        prev = pos
+
+    excluded_ranges = _merge(sorted([s, e] for (kind, _), (s, e) in hits.items() if kind == EXCLUSION))
+    conflicts = []
+    for (kind, payload), (s, e) in sorted(hits.items(), key=lambda item: item[1][0]):
+        if kind != EXCLUSION and any(xs <= s and e <= xe for xs, xe in excluded_ranges):
+            # 已被管理员排除覆盖的端口不会被临时分配，不算冲突
+            continue
+        if kind == SERVICE:
+            detail = f"{payload[1]}({payload[0]})"
+        elif kind == LISTENER:
+            detail = str(payload)
+        else:
+            detail = f"{s}-{e}" if s != e else str(s)
+        conflicts.append({'kind': kind, 'start': s, 'end': e, 'detail': detail})
+
+    freed = _merge([list(r) for r in freed])
+    return {
+        'start': start,
+        'end': end,
+        'conflicts': conflicts,
+        'usable_new': usable_new,
+        'usable_old': usable_old,
+        'net_change': usable_new - usable_old,
+        'freed': freed,
+        'freed_count': sum(e - s + 1 for s, e in freed),
+    }
+
+
+def real_conflicts(report):
+    """需要提示用户的冲突，管理员排除本身只减少可用端口，不算冲突"""
+    return [c for c in report['conflicts'] if c['kind'] != EXCLUSION]
+
+
+def format_impact(report, limit=4):
+    """把分析结果格式化为简短的中文说明"""
+    lines = [f"可用临时端口 {report['usable_old']} → {report['usable_new']} ({report['net_change']:+d})"]
+    if report['freed']:
+        freed = ", ".join(f"{s}-{e}" if s != e else str(s) for s, e in report['freed'][:limit])
+        lines.append(f"释放 {report['freed_count']} 个端口: {freed}")
+
+    conflicts = real_conflicts(report)
+    if conflicts:
+        text = ", ".join(f"{CONFLICT_LABELS[c['kind']]} {c['detail']}" for c in conflicts[:limit])
+        if len(conflicts) > limit:
+            text += f" 等 {len(conflicts)} 项"
+        lines.append(f"冲突: {text}")
+    else:
+        lines.append("无冲突")
+    return "\n".join(lines)
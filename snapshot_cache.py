@@ -0,0 +1,240 @@
+"""
+跨进程共享的端口状态快照缓存
+快照保存在内存映射文件中：一个进程加写锁刷新，其他进程直接读取，避免重复执行 netsh / dism
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from async_port_manager import collect_status_sync
+
+CACHE_NAME = "port_manager_snapshot.bin"
+CACHE_SIZE = 1 << 20
+
+MAGIC = b"PMSC"
+VERSION = 1
+# magic, version, seq, generation, epoch, data_epoch, timestamp, length
+HEADER = struct.Struct("<4sIQQQQdI")
+SEQ_OFFSET = 8
+GENERATION_OFFSET = 16
+EPOCH_OFFSET = 24
+DATA_OFFSET = 32
+U64 = struct.Struct("<Q")
+# data_epoch, timestamp, length
+DATA_INFO = struct.Struct("<QdI")
+# 读者等待写入完成的最长时间，超时视为写入进程已退出
+READ_TIMEOUT = 0.5
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.01)
+
+    def _unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def collect_snapshot():
+    """并发执行命令收集一份完整的端口状态快照"""
+    return collect_status_sync()
+
+
+class SharedSnapshotCache:
+    """
+    基于内存映射文件的快照缓存
+
+    头部使用顺序锁（seq 为奇数表示正在写入），读者无需加锁；
+    generation 每次刷新加一，读者发现 generation 未变化时直接复用已解码的快照。
+    invalidate() 递增 epoch，快照记录刷新时的 epoch，不一致即视为过期。
+    """
+
+    def __init__(self, path=None, collector=None, max_age=30.0):
+        self.path = path or os.path.join(tempfile.gettempdir(), CACHE_NAME)
+        self.collector = collector or collect_snapshot
+        self.max_age = max_age
+        self._last_generation = None
+        self._last_snapshot = None
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < CACHE_SIZE:
+            os.ftruncate(fd, CACHE_SIZE)
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        # flock 按打开的文件生效，不能排斥同一进程中共用 _lock_fd 的其他线程
+        self._thread_lock = threading.Lock()
+        self._mm = mmap.mmap(fd, CACHE_SIZE)
+        os.close(fd)
+
+        with self._locked():
+            if self._mm[:4] != MAGIC:
+                HEADER.pack_into(self._mm, 0, MAGIC, VERSION, 0, 0, 1, 0, 0.0, 0)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            _lock_file(self._lock_fd)
+            try:
+                yield
+            finally:
+                _unlock_file(self._lock_fd)
+
+    def _header(self):
+        return HEADER.unpack_from(self._mm, 0)
+
+    def read(self):
+        """
+        读取当前快照，返回 (快照, 元信息)；尚无有效快照时返回 (None, None)
+
+        元信息包含 generation、timestamp、stale。
+        写入方在写入中途退出会留下奇数的 seq，等待超过 READ_TIMEOUT 后按无快照处理，
+        由加锁刷新的一方修复
+        """
+        deadline = None
+        while True:
+            _, _, seq, generation, epoch, data_epoch, timestamp, length = self._header()
+            if seq & 1:
+                if deadline is None:
+                    deadline = time.monotonic() + READ_TIMEOUT
+                elif time.monotonic() > deadline:
+                    return None, None
+                time.sleep(0)
+                continue
+            if generation == 0:
+                return None, None
+            if generation == self._last_generation:
+                snapshot = self._last_snapshot
+            else:
+                raw = self._mm[HEADER.size:HEADER.size + length]
+                if U64.unpack_from(self._mm, SEQ_OFFSET)[0] != seq:
+                    continue
+                snapshot = json.loads(raw)
+                self._last_generation = generation
+                self._last_snapshot = snapshot
+            meta = {
+                'generation': generation,
+                'timestamp': timestamp,
+                'stale': epoch != data_epoch,
+            }
+            return snapshot, meta
+
+    def _is_fresh(self, meta, max_age):
+        return meta is not None and not meta['stale'] and time.time() - meta['timestamp'] <= max_age
+
+    def get(self, force=False, max_age=None):
+        """获取快照，过期或被失效时由当前进程加锁刷新"""
+        max_age = self.max_age if max_age is None else max_age
+        if not force:
+            snapshot, meta = self.read()
+            if self._is_fresh(meta, max_age):
+                return snapshot
+
+        seen = self._header()[3]
+        with self._locked():
+            self._repair_locked()
+            # 等锁期间其他进程可能已经刷新过
+            snapshot, meta = self.read()
+            if self._is_fresh(meta, max_age) and (not force or meta['generation'] != seen):
+                return snapshot
+            return self._refresh_locked()
+
+    def refresh(self):
+        """强制重新收集并写入快照"""
+        with self._locked():
+            self._repair_locked()
+            return self._refresh_locked()
+
+    def _repair_locked(self):
+        """
+        持锁时 seq 仍为奇数说明上一个写入进程在写入中途退出，
+        恢复为偶数并让残留数据过期
+        """
+        seq = U64.unpack_from(self._mm, SEQ_OFFSET)[0]
+        if seq & 1:
+            self.invalidate()
+            U64.pack_into(self._mm, SEQ_OFFSET, seq + 1)
+
+    def _refresh_locked(self):
+        epoch = U64.unpack_from(self._mm, EPOCH_OFFSET)[0]
+        snapshot = self.collector()
+        payload = json.dumps(snapshot, ensure_ascii=False).encode("utf-8")
+        if HEADER.size + len(payload) > CACHE_SIZE:
+            raise ValueError("快照过大，无法写入共享缓存")
+
+        # epoch 字段由 invalidate() 无锁更新，这里不覆盖它
+        _, _, seq, generation, _, _, _, _ = self._header()
+        U64.pack_into(self._mm, SEQ_OFFSET, seq + 1)
+        self._mm[HEADER.size:HEADER.size + len(payload)] = payload
+        U64.pack_into(self._mm, GENERATION_OFFSET, generation + 1)
+        DATA_INFO.pack_into(self._mm, DATA_OFFSET, epoch, time.time(), len(payload))
+        U64.pack_into(self._mm, SEQ_OFFSET, seq + 2)
+
+        self._last_generation = generation + 1
+        self._last_snapshot = snapshot
+        return snapshot
+
+    def invalidate(self, reason=None):
+        """标记快照过期，所有进程下次读取时会重新收集"""
+        epoch = U64.unpack_from(self._mm, EPOCH_OFFSET)[0]
+        U64.pack_into(self._mm, EPOCH_OFFSET, epoch + 1)
+
+    def close(self):
+        """释放映射和锁文件"""
+        self._mm.close()
+        os.close(self._lock_fd)
+
+
+_shared_cache = None
+
+
+def get_shared_cache():
+    """获取本进程的共享快照缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SharedSnapshotCache()
+    return _shared_cache
+
+
+def invalidate_shared_cache(path=None):
+    """
+    让共享快照失效，由 port_manager.notify_mutation 在每次修改后调用
+
+    本进程未打开缓存时直接映射已有的缓存文件递增 epoch，文件不存在则无需处理
+    """
+    path = path or os.path.join(tempfile.gettempdir(), CACHE_NAME)
+    if _shared_cache is not None and _shared_cache.path == path:
+        _shared_cache.invalidate()
+        return
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return
+    try:
+        if os.fstat(fd).st_size < HEADER.size:
+            return
+        with mmap.mmap(fd, HEADER.size) as mm:
+            if mm[:4] == MAGIC:
+                epoch = U64.unpack_from(mm, EPOCH_OFFSET)[0]
+                U64.pack_into(mm, EPOCH_OFFSET, epoch + 1)
+    finally:
+        os.close(fd)
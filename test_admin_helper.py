@@ -0,0 +1,121 @@
+"""
+admin_helper 回环套接字传输的测试，助手使用假的操作表，不需要管理员权限
+"""
+import socket
+import threading
+import unittest
+
+import admin_helper
+import port_manager
+from admin_helper import HelperClient, HelperDisconnected, HelperError, accept_helper, run_helper
+
+TOKEN = "test-token"
+
+
+class FakeOperations(dict):
+    def __init__(self):
+        super().__init__(add=self.add, fail=self.fail)
+
+    def add(self, a, b):
+        port_manager.notify_mutation("add_port_exclusion")
+        return [True, a + b]
+
+    def fail(self):
+        raise RuntimeError("boom")
+
+
+class HelperTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = admin_helper._listen_loopback()
+        self.port = self.listener.getsockname()[1]
+        self.operations = FakeOperations()
+        # run_helper 会在本进程中关闭共享快照失效，测试结束后恢复
+        self.addCleanup(port_manager.set_shared_cache_invalidation, True)
+        self.addCleanup(self.listener.close)
+
+    def start_helper(self, token=TOKEN):
+        result = {}
+
+        def run():
+            result['served'] = run_helper(self.port, token, self.operations, timeout=5)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread, result
+
+    def connect(self):
+        thread, result = self.start_helper()
+        conn = accept_helper(self.listener, TOKEN, timeout=5)
+        self.assertIsNotNone(conn)
+        client = HelperClient(conn)
+        self.addCleanup(client.close)
+        return client, thread, result
+
+    def test_bad_token_is_rejected_and_listener_keeps_waiting(self):
+        intruder = socket.create_connection(("127.0.0.1", self.port))
+        admin_helper.send_message(intruder, {"token": "wrong"})
+        thread, result = self.start_helper()
+        conn = accept_helper(self.listener, TOKEN, timeout=5)
+        self.assertIsNotNone(conn)
+        # 令牌错误的连接被直接关闭
+        intruder.settimeout(5)
+        self.assertIsNone(admin_helper.recv_message(intruder))
+        intruder.close()
+        HelperClient(conn).shutdown()
+        thread.join(5)
+        self.assertTrue(result['served'])
+
+    def test_helper_with_bad_token_gets_no_session(self):
+        thread, result = self.start_helper(token="wrong")
+        self.assertIsNone(accept_helper(self.listener, TOKEN, timeout=0.5))
+        thread.join(5)
+        self.assertFalse(result['served'])
+
+    def test_batch_results_and_errors(self):
+        client, thread, _ = self.connect()
+        results = client.call_batch([("add", [1, 2]), ("fail", []), ("missing", [])])
+        self.assertEqual(results[0], {'ok': True, 'value': [True, 3]})
+        self.assertEqual(results[1], {'ok': False, 'error': "boom"})
+        self.assertFalse(results[2]['ok'])
+        self.assertEqual(client.call("add", 5, 6), [True, 11])
+        with self.assertRaises(HelperError):
+            client.call("fail")
+        client.shutdown()
+        thread.join(5)
+
+    def test_mutations_are_forwarded_to_front_end(self):
+        client, thread, _ = self.connect()
+        seen = []
+        port_manager.add_mutation_listener(seen.append)
+        self.addCleanup(port_manager.remove_mutation_listener, seen.append)
+        client.call_batch([("add", [1, 1]), ("add", [2, 2])])
+        # 同一进程中助手自身也会通知一次，前端再为每个修改转发一次
+        self.assertEqual(seen.count("add_port_exclusion"), 4)
+        client.shutdown()
+        thread.join(5)
+
+    def test_shutdown_stops_helper(self):
+        client, thread, result = self.connect()
+        client.shutdown()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(result['served'])
+
+    def test_call_after_helper_exit_raises_disconnected(self):
+        client, thread, _ = self.connect()
+        # 绕过客户端直接让助手退出，客户端仍持有已被对端关闭的连接
+        admin_helper.send_message(client._sock, {"shutdown": True})
+        admin_helper.recv_message(client._sock)
+        thread.join(5)
+        with self.assertRaises(HelperDisconnected):
+            client.call("add", 1, 2)
+
+    def test_late_helper_exits_when_front_end_gave_up(self):
+        self.assertIsNone(accept_helper(self.listener, TOKEN, timeout=0.2))
+        self.listener.close()
+        self.assertFalse(run_helper(self.port, TOKEN, self.operations, timeout=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
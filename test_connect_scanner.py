@@ -0,0 +1,76 @@
+"""
+connect_scanner 在本机回环地址上的测试
+"""
+import socket
+import sys
+import unittest
+
+import connect_scanner
+from connect_scanner import OPEN, CLOSED, scan_hosts, parse_ports
+
+
+def _free_ports(count):
+    """获取若干当前未被占用的端口"""
+    holders = []
+    for _ in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("127.0.0.1", 0))
+        holders.append(s)
+    ports = [s.getsockname()[1] for s in holders]
+    for s in holders:
+        s.close()
+    return ports
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "依赖 Linux 回环地址的行为")
+class LoopbackScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+        for _ in range(10):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            s.listen(16)
+            self.servers.append(s)
+        self.listening = {s.getsockname()[1] for s in self.servers}
+
+    def tearDown(self):
+        for s in self.servers:
+            s.close()
+
+    def test_reports_exactly_the_listeners(self):
+        closed = set(_free_ports(200)) - self.listening
+        result = scan_hosts(["127.0.0.1"], sorted(self.listening | closed), concurrency=64)
+        self.assertEqual({port for _, port in result['open']}, self.listening)
+        self.assertEqual(result['probes'], len(self.listening | closed))
+        self.assertTrue(all(states == {"127.0.0.1": OPEN} for states in result['ports'].values()))
+
+    def test_include_closed(self):
+        closed = set(_free_ports(20)) - self.listening
+        result = scan_hosts(["127.0.0.1"], sorted(closed), include_closed=True)
+        self.assertEqual(result['open'], [])
+        self.assertEqual({port for port, states in result['ports'].items()
+                          if states["127.0.0.1"] == CLOSED}, closed)
+
+    def test_self_connect_is_closed(self):
+        # 绑定后连接自己的地址，Linux 上会形成 TCP 自连接
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("127.0.0.1", 0))
+            try:
+                s.connect(s.getsockname())
+            except OSError:
+                self.skipTest("系统不支持 TCP 自连接")
+            self.assertEqual(connect_scanner._connected_state(s), CLOSED)
+        finally:
+            s.close()
+
+
+class ParsePortsTest(unittest.TestCase):
+
+    def test_ranges_and_single_ports(self):
+        self.assertEqual(parse_ports("3000, 8080-8082,,9000"), [3000, 8080, 8081, 8082, 9000])
+
+
+if __name__ == "__main__":
+    unittest.main()
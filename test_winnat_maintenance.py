@@ -0,0 +1,149 @@
+"""
+winnat_maintenance.reclaim_ports 的测试，使用假的服务控制器和排除操作
+"""
+import unittest
+
+from winnat_maintenance import reclaim_ports
+
+
+class FakeClock:
+    """每次读取前进 1 秒的时钟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class FakeController:
+    def __init__(self, stop_results=(True,), start_results=(True,), running_after_failed_stop=True):
+        self.stop_results = list(stop_results)
+        self.start_results = list(start_results)
+        self.running_after_failed_stop = running_after_failed_stop
+        self.running = True
+        self.calls = []
+
+    def stop(self):
+        self.calls.append("stop")
+        ok = self.stop_results.pop(0) if len(self.stop_results) > 1 else self.stop_results[0]
+        if ok:
+            self.running = False
+        else:
+            self.running = self.running_after_failed_stop
+        return ok, "" if ok else "stop failed"
+
+    def start(self):
+        self.calls.append("start")
+        ok = self.start_results.pop(0) if len(self.start_results) > 1 else self.start_results[0]
+        if ok:
+            self.running = True
+        return ok, "" if ok else "start failed"
+
+    def is_running(self):
+        self.calls.append("is_running")
+        return self.running
+
+
+class FakeActions:
+    """记录调用顺序，fail 中的 (action, start) 返回失败"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+
+    def _run(self, action, start, end):
+        self.calls.append((action, start, end))
+        if (action, start) in self.fail:
+            return False, f"{action} {start} failed"
+        return True, ""
+
+    def table(self):
+        return {
+            "add": lambda start, end: self._run("add", start, end),
+            "delete": lambda start, end: self._run("delete", start, end),
+        }
+
+
+class ReclaimPortsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+
+    def reclaim(self, operations, controller, actions, retries=3):
+        return reclaim_ports(operations, controller, actions.table(), retries=retries, backoff=0.1,
+                             clock=FakeClock(), sleep=self.sleeps.append)
+
+    def test_success_applies_in_order_and_counts_downtime(self):
+        controller = FakeController()
+        actions = FakeActions()
+        ok, msg, report = self.reclaim([("add", 3000, 3010), ("delete", 4000)], controller, actions)
+        self.assertTrue(ok, msg)
+        self.assertEqual(actions.calls, [("add", 3000, 3010), ("delete", 4000, 4000)])
+        self.assertEqual(controller.calls, ["stop", "start"])
+        self.assertEqual(report['downtime'], 1.0)
+        self.assertTrue(report['winnat_running'])
+
+    def test_invalid_operation_does_not_stop_service(self):
+        controller = FakeController()
+        ok, msg, report = self.reclaim([("add", 70000, 70001)], controller, FakeActions())
+        self.assertFalse(ok)
+        self.assertEqual(controller.calls, [])
+
+    def test_failure_rolls_back_in_reverse_order(self):
+        actions = FakeActions(fail={("add", 5000)})
+        ok, msg, report = self.reclaim(
+            [("add", 3000, 3010), ("delete", 4000, 4001), ("add", 5000, 5000)], FakeController(), actions)
+        self.assertFalse(ok)
+        self.assertEqual(actions.calls[3:], [("add", 4000, 4001), ("delete", 3000, 3010)])
+        self.assertEqual(report['rolled_back'], [("delete", 4000, 4001), ("add", 3000, 3010)])
+        self.assertEqual(report['failed'][:3], ("add", 5000, 5000))
+        self.assertTrue(report['winnat_running'])
+
+    def test_partial_rollback_failure_is_reported(self):
+        actions = FakeActions(fail={("add", 5000), ("delete", 3000)})
+        ok, msg, report = self.reclaim(
+            [("add", 3000, 3010), ("add", 4000, 4000), ("add", 5000, 5000)], FakeController(), actions)
+        self.assertFalse(ok)
+        self.assertEqual(report['rolled_back'], [("add", 4000, 4000)])
+        self.assertEqual([item[:3] for item in report['rollback_failed']], [("add", 3000, 3010)])
+        self.assertIn("3000-3010", msg)
+
+    def test_start_is_retried_with_backoff(self):
+        controller = FakeController(start_results=(False, False, True))
+        ok, msg, report = self.reclaim([("add", 3000, 3000)], controller, FakeActions())
+        self.assertTrue(ok, msg)
+        self.assertEqual(report['start_attempts'], 3)
+        self.assertEqual(self.sleeps, [0.05, 0.1])
+
+    def test_start_failure_leaves_service_down(self):
+        controller = FakeController(start_results=(False,))
+        ok, msg, report = self.reclaim([("add", 3000, 3000)], controller, FakeActions(), retries=2)
+        self.assertFalse(ok)
+        self.assertFalse(report['winnat_running'])
+        self.assertIn("net start winnat", msg)
+
+    def test_failed_stop_while_running_changes_nothing(self):
+        controller = FakeController(stop_results=(False,))
+        actions = FakeActions()
+        ok, msg, report = self.reclaim([("add", 3000, 3000)], controller, actions)
+        self.assertFalse(ok)
+        self.assertEqual(actions.calls, [])
+        self.assertEqual(report['stop_attempts'], 3)
+        self.assertNotIn("start", controller.calls)
+        self.assertTrue(report['winnat_running'])
+
+    def test_failed_stop_with_service_down_restarts_it(self):
+        controller = FakeController(stop_results=(False,), running_after_failed_stop=False)
+        actions = FakeActions()
+        ok, msg, report = self.reclaim([("add", 3000, 3000)], controller, actions)
+        self.assertFalse(ok)
+        self.assertEqual(actions.calls, [])
+        self.assertEqual(controller.calls[-2:], ["is_running", "start"])
+        self.assertTrue(report['winnat_running'])
+        self.assertTrue(controller.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+winnat 维护操作
+停止 winnat -> 批量添加/删除端口排除 -> 启动 winnat，尽量缩短 NAT 中断时间
+"""
+import time
+
+from port_manager import run_cmd, add_port_exclusion, delete_port_exclusion, notify_mutation
+
+
+class WinnatController:
+    """通过 net / sc 命令控制 winnat 服务"""
+
+    def __init__(self, service="winnat"):
+        self.service = service
+
+    def stop(self):
+        """停止服务，已停止也视为成功"""
+        stdout, stderr, code = run_cmd(f"net stop {self.service}")
+        text = (stdout + stderr).lower()
+        # NET HELPMSG 3521: 服务未启动
+        if code == 0 or "3521" in text or "not been started" in text or "没有启动" in text:
+            return True, ""
+        return False, stderr or stdout or "停止服务失败"
+
+    def start(self):
+        """启动服务，已启动也视为成功"""
+        stdout, stderr, code = run_cmd(f"net start {self.service}")
+        text = (stdout + stderr).lower()
+        # NET HELPMSG 2182: 服务已经启动
+        if code == 0 or "2182" in text or "already been started" in text or "已经启动" in text:
+            return True, ""
+        return False, stderr or stdout or "启动服务失败"
+
+    def is_running(self):
+        """服务是否正在运行"""
+        stdout, _, _ = run_cmd(f"sc query {self.service}")
+        return "RUNNING" in stdout
+
+
+def _normalize_operations(operations):
+    """校验并规范化操作列表，返回 [(action, start, end)]"""
+    normalized = []
+    for op in operations:
+        action, start = op[0], int(op[1])
+        end = int(op[2]) if len(op) > 2 and op[2] is not None else start
+        if action not in ("add", "delete"):
+            raise ValueError(f"未知操作: {action}")
+        if start < 1 or end > 65535 or start > end:
+            raise ValueError(f"端口范围无效: {start}-{end}")
+        normalized.append((action, start, end))
+    return normalized
+
+
+def _retry(func, retries, backoff, sleep):
+    """按指数退避重试 func，返回 (成功, 消息, 尝试次数)"""
+    msg = ""
+    for attempt in range(1, retries + 1):
+        ok, msg = func()
+        if ok:
+            return True, msg, attempt
+        if attempt < retries:
+            sleep(backoff * (2 ** (attempt - 1)))
+    return False, msg, retries
+
+
+def reclaim_ports(operations, controller=None, actions=None, retries=3, backoff=0.2,
+                  clock=time.perf_counter, sleep=time.sleep):
+    """
+    停止 winnat 后批量应用端口排除变更，再重新启动 winnat
+
+    operations: [("add"|"delete", start, end), ...]
+    controller: 提供 stop()/start()/is_running() 的服务控制器，默认 WinnatController
+    actions: {"add": func, "delete": func}，默认使用 add/delete_port_exclusion
+
+    返回 (成功, 消息, 报告)，报告中 downtime 为 NAT 中断秒数
+    """
+    controller = controller or WinnatController()
+    actions = actions or {"add": add_port_exclusion, "delete": delete_port_exclusion}
+    report = {
+        'applied': [],
+        'failed': None,
+        'rolled_back': [],
+        'rollback_failed': [],
+        'downtime': 0.0,
+        'stop_attempts': 0,
+        'start_attempts': 0,
+        'winnat_running': True,
+    }
+
+    # 停服务前完成全部校验，中断窗口内只执行 netsh
+    try:
+        ops = _normalize_operations(operations)
+    except (ValueError, TypeError, IndexError) as e:
+        return False, str(e), report
+    if not ops:
+        return True, "没有需要执行的操作", report
+
+    down_at = None
+
+    def do_stop():
+        nonlocal down_at
+        down_at = clock()
+        return controller.stop()
+
+    ok, msg, report['stop_attempts'] = _retry(do_stop, retries, backoff, sleep)
+    if not ok:
+        # net stop 超时等情况下服务可能已停止或正在停止，此时要把它启动回来
+        if controller.is_running():
+            return False, f"停止 winnat 失败: {msg}", report
+        started, start_msg, report['start_attempts'] = _retry(controller.start, retries, backoff / 2, sleep)
+        report['downtime'] = clock() - down_at
+        report['winnat_running'] = started
+        notify_mutation("reclaim_ports")
+        if not started:
+            return False, f"停止 winnat 失败且服务未在运行，请手动执行 net start winnat: {start_msg}", report
+        return False, f"停止 winnat 失败，已重新启动服务: {msg}", report
+    report['winnat_running'] = False
+
+    error = None
+    for action, start, end in ops:
+        ok, msg = actions[action](start, end)
+        if not ok:
+            report['failed'] = (action, start, end, msg)
+            error = msg
+            break
+        report['applied'].append((action, start, end))
+
+    # 失败时按相反顺序撤销已执行的操作
+    if error is not None:
+        inverse = {"add": "delete", "delete": "add"}
+        for action, start, end in reversed(report['applied']):
+            ok, msg = actions[inverse[action]](start, end)
+            if ok:
+                report['rolled_back'].append((action, start, end))
+            else:
+                report['rollback_failed'].append((action, start, end, msg))
+
+    # 启动使用较短的退避，尽快恢复 NAT
+    ok, start_msg, report['start_attempts'] = _retry(controller.start, retries, backoff / 2, sleep)
+    report['downtime'] = clock() - down_at
+    report['winnat_running'] = ok
+    # winnat 重启后系统预留会重新分配
+    notify_mutation("reclaim_ports")
+
+    leftover = ""
+    if report['rollback_failed']:
+        remaining = ", ".join(f"{action} {start}-{end}" for action, start, end, _ in report['rollback_failed'])
+        leftover = f"\n以下操作未能撤销，仍然生效: {remaining}"
+
+    if not ok:
+        return False, f"winnat 启动失败，请手动执行 net start winnat: {start_msg}{leftover}", report
+    if error is not None:
+        return False, f"操作失败，已回滚 {len(report['rolled_back'])} 项: {error}{leftover}", report
+    return True, f"已完成 {len(ops)} 项操作，NAT 中断 {report['downtime']:.2f} 秒", report
@@ -0,0 +1,337 @@
+"""
+工作区端口扫描
+并行遍历项目目录，从 package.json、docker-compose、.env、Vite/webpack 等配置中提取项目声明的端口，
+生成去重合并后的端口范围列表，可用于添加端口保护或写入 config.json 的 protected_ports
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+CACHE_DIR_NAME = "port_manager"
+
+SKIP_DIRS = {
+    "node_modules", ".git", ".hg", ".svn", "__pycache__", ".venv", "venv",
+    "dist", "build", "target", "out", ".next", ".nuxt", ".idea", ".vscode",
+    ".gradle", ".cache", "coverage", "vendor",
+}
+
+CONFIG_PREFIXES = (
+    "vite.config.", "webpack.config.", "webpack.dev.", "vue.config.", "next.config.",
+    "nuxt.config.", "astro.config.", "svelte.config.", "rollup.config.", "angular.json",
+    "playwright.config.", "jest-puppeteer.config.",
+)
+SPRING_NAMES = ("application.properties", "application.yml", "application.yaml")
+# 单个文件超过该大小时跳过，避免读取生成的大文件
+MAX_FILE_SIZE = 1 << 20
+# 需要解析的文件少于该数量时不启用进程池
+PARALLEL_THRESHOLD = 64
+# 并行遍历时每个任务最多处理的目录数，剩余目录交回主进程重新分配
+WALK_BATCH = 256
+
+SCRIPT_PORT_RE = re.compile(r'(?:--port|--listen)(?:[=\s:]+)(\d{2,5})\b|\bPORT=(\d{2,5})\b')
+# -p 在 mkdir、tsc 等命令中另有含义，只在已知的开发服务器命令中识别
+SCRIPT_SHORT_PORT_RE = re.compile(
+    r'\b(?:next|nuxt|nuxi|serve|http-server|live-server|json-server|webpack-dev-server|'
+    r'hexo|gatsby|docusaurus|remix|astro|vite|ng)\b[^&|;]*?\s-p[=\s]*(\d{2,5})\b'
+)
+COMPOSE_SHORT_RE = re.compile(
+    r'^\s*-\s*["\']?(?:\$\{\w+:-(\d{1,5})\}|(?:[\d.]+:)?(\d{1,5})(?:-(\d{1,5}))?)'
+    r':\d{1,5}(?:-\d{1,5})?(?:/\w+)?["\']?\s*$',
+    re.MULTILINE,
+)
+COMPOSE_PUBLISHED_RE = re.compile(r'^\s*published\s*:\s*["\']?(\d{1,5})', re.MULTILINE)
+# 变量名中 PORT 须为独立的一段，如 PORT、DB_PORT、PORT_HTTP，排除 REPORT_INTERVAL、IMPORT_BATCH 等
+ENV_PORT_RE = re.compile(r'^\s*(?:export\s+)?(?:\w+_)?PORT(?:_\w+)?\s*=\s*["\']?(\d{2,5})["\']?\s*$',
+                         re.MULTILINE | re.IGNORECASE)
+# 兼容 JSON 中带引号的键，如 angular.json 的 "port": 4200
+CONFIG_PORT_RE = re.compile(r'\bport["\']?\s*[:=]\s*["\']?(\d{2,5})\b', re.IGNORECASE)
+SPRING_PORT_RE = re.compile(r'^\s*(?:server\.)?port\s*[:=]\s*(\d{2,5})\b', re.MULTILINE)
+
+
+def classify(name):
+    """判断文件名属于哪种端口来源，不需要扫描时返回 None"""
+    if name == "package.json":
+        return "package"
+    if name.startswith(".env"):
+        return "env"
+    if name.startswith(("docker-compose", "compose.")) and name.endswith((".yml", ".yaml")):
+        return "compose"
+    if name in SPRING_NAMES:
+        return "spring"
+    if name.startswith(CONFIG_PREFIXES):
+        return "config"
+    return None
+
+
+def _valid(port):
+    return 1 <= port <= 65535
+
+
+def extract_ports(kind, text):
+    """从文件内容中提取端口，返回 [(start, end)]"""
+    ranges = []
+
+    if kind == "package":
+        try:
+            scripts = json.loads(text).get("scripts") or {}
+        except (ValueError, AttributeError):
+            scripts = {}
+        for command in scripts.values():
+            if isinstance(command, str):
+                ranges += [(int(a or b), int(a or b)) for a, b in SCRIPT_PORT_RE.findall(command)]
+                ranges += [(int(p), int(p)) for p in SCRIPT_SHORT_PORT_RE.findall(command)]
+    elif kind == "compose":
+        for default, start, end in COMPOSE_SHORT_RE.findall(text):
+            if default:
+                ranges.append((int(default), int(default)))
+            elif start:
+                ranges.append((int(start), int(end or start)))
+        ranges += [(int(p), int(p)) for p in COMPOSE_PUBLISHED_RE.findall(text)]
+    elif kind == "env":
+        ranges += [(int(p), int(p)) for p in ENV_PORT_RE.findall(text)]
+    elif kind == "spring":
+        ranges += [(int(p), int(p)) for p in SPRING_PORT_RE.findall(text)]
+    else:
+        ranges += [(int(p), int(p)) for p in CONFIG_PORT_RE.findall(text)]
+
+    return [(s, e) for s, e in ranges if _valid(s) and _valid(e) and s <= e]
+
+
+def coalesce_ranges(ranges):
+    """排序并合并重叠或相邻的端口范围"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _walk(tops, budget=None):
+    """
+    遍历目录，返回 (候选文件 [(路径, mtime_ns, size)], 未处理的目录)
+
+    budget 为本次最多处理的目录数，None 表示全部遍历完
+    """
+    found = []
+    stack = list(tops)
+    while stack and (budget is None or budget > 0):
+        if budget is not None:
+            budget -= 1
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                stack.append(entry.path)
+                        elif classify(entry.name):
+                            st = entry.stat()
+                            if st.st_size <= MAX_FILE_SIZE:
+                                found.append((entry.path, st.st_mtime_ns, st.st_size))
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return found, stack
+
+
+def _walk_parallel(pool, subdirs, workers):
+    """
+    在进程池中遍历目录树
+
+    每个任务只处理 WALK_BATCH 个目录，尚未遍历的子目录交回后拆分成新任务，
+    只有一个顶层目录（如 packages/、src/）的仓库也能用满所有进程
+    """
+    candidates = []
+    futures = {pool.submit(_walk, [subdir], WALK_BATCH) for subdir in subdirs}
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            found, rest = future.result()
+            candidates += found
+            if rest:
+                parts = min(len(rest), workers)
+                futures |= {pool.submit(_walk, rest[i::parts], WALK_BATCH) for i in range(parts)}
+    return candidates
+
+
+def _parse_file(args):
+    """读取并解析单个文件，内容哈希未变时沿用缓存结果"""
+    path, mtime, size, cached_hash, cached_ports = args
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return path, mtime, size, None, []
+    digest = hashlib.sha1(data).hexdigest()
+    if digest == cached_hash:
+        return path, mtime, size, digest, cached_ports
+    text = data.decode("utf-8", errors="ignore")
+    ports = extract_ports(classify(os.path.basename(path)), text)
+    return path, mtime, size, digest, [list(r) for r in ports]
+
+
+def default_cache_path(root):
+    """按扫描目录生成用户缓存目录下的缓存文件路径，不在项目目录中留下文件"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    key = hashlib.sha1(os.path.normcase(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(base, CACHE_DIR_NAME, "scan_cache", key + ".json")
+
+
+def load_cache(path):
+    """读取扫描缓存 {文件: [mtime_ns, size, sha1, 端口范围]}"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    """保存扫描缓存"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        return True
+    except OSError:
+        return False
+
+
+def scan_workspace(root, cache_path=None, workers=None):
+    """
+    扫描目录树中声明的端口
+
+    返回 {'ranges': 合并后的 [[start, end]], 'sources': {文件: 端口范围},
+          'files': 候选文件数, 'parsed': 实际重新解析的文件数}
+    """
+    root = os.path.abspath(root)
+    cache_path = cache_path or default_cache_path(root)
+    cache = load_cache(cache_path)
+    workers = workers or os.cpu_count() or 1
+
+    # 子目录分给进程池并行遍历
+    subdirs = []
+    candidates = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        subdirs.append(entry.path)
+                elif classify(entry.name):
+                    st = entry.stat()
+                    candidates.append((entry.path, st.st_mtime_ns, st.st_size))
+    except OSError as e:
+        return {'ranges': [], 'sources': {}, 'files': 0, 'parsed': 0, 'error': str(e)}
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and subdirs else None
+    try:
+        if pool:
+            candidates += _walk_parallel(pool, subdirs, workers)
+        else:
+            candidates += _walk(subdirs)[0]
+
+        # mtime 和大小都未变化的文件直接使用缓存
+        new_cache = {}
+        pending = []
+        for path, mtime, size in candidates:
+            entry = cache.get(path)
+            if entry and entry[0] == mtime and entry[1] == size:
+                new_cache[path] = entry
+            else:
+                pending.append((path, mtime, size,
+                                entry[2] if entry else None, entry[3] if entry else []))
+
+        if len(pending) >= PARALLEL_THRESHOLD and workers > 1:
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(_parse_file, pending, chunksize=max(1, len(pending) // (workers * 4)))
+        else:
+            results = map(_parse_file, pending)
+        for path, mtime, size, digest, ports in results:
+            if digest is not None:
+                new_cache[path] = [mtime, size, digest, ports]
+    finally:
+        if pool:
+            pool.shutdown()
+
+    save_cache(cache_path, new_cache)
+
+    sources = {path: entry[3] for path, entry in new_cache.items() if entry[3]}
+    all_ranges = [tuple(r) for ranges in sources.values() for r in ranges]
+    return {
+        'ranges': coalesce_ranges(all_ranges),
+        'sources': sources,
+        'files': len(candidates),
+        'parsed': len(pending),
+    }
+
+
+def merge_into_config(config, ranges):
+    """把端口范围合并进 config['protected_ports']，返回新增的范围"""
+    protected = config.setdefault("protected_ports", [])
+    added = []
+    for start, end in ranges:
+        covered = any(s <= start and end <= e for s, e in protected)
+        if not covered:
+            protected.append([start, end])
+            added.append([start, end])
+    return added
+
+
+def main(argv=None):
+    """命令行入口：python workspace_scanner.py <目录> [--merge-config] [--apply]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="扫描项目目录中声明的端口")
+    parser.add_argument("root", help="要扫描的目录")
+    parser.add_argument("--cache", help="缓存文件路径，默认在用户缓存目录下")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数")
+    parser.add_argument("--merge-config", action="store_true", help="合并到 config.json 的 protected_ports")
+    parser.add_argument("--apply", action="store_true", help="对扫描到的端口添加管理员排除")
+    args = parser.parse_args(argv)
+
+    result = scan_workspace(args.root, args.cache, args.workers)
+    if result.get('error'):
+        print(f"扫描失败: {result['error']}")
+        return 1
+    print(f"候选文件 {result['files']} 个，重新解析 {result['parsed']} 个")
+    for start, end in result['ranges']:
+        print(f"  {start}" if start == end else f"  {start}-{end}")
+
+    if args.merge_config:
+        from config_manager import load_config, save_config
+        config = load_config()
+        added = merge_into_config(config, result['ranges'])
+        if added and save_config(config):
+            print(f"已写入配置 {len(added)} 个范围")
+
+    if args.apply:
+        # 与 GUI 一样，非管理员时通过管理员助手执行
+        from admin_helper import open_operations
+        ops, err = open_operations()
+        if ops is None:
+            print(err)
+            return 1
+        try:
+            results = ops.batch([("add_port_exclusion", [start, end]) for start, end in result['ranges']])
+        finally:
+            ops.close()
+        for item in results:
+            print(item['value'][1] if item['ok'] else item['error'])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+WSL 发行版监听端口采集
+单次流式解析 /proc/net/tcp、tcp6、udp、udp6，生成紧凑的监听表并与 Windows 端口排除合并
+"""
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from itertools import compress
+
+from port_manager import run_cmd
+
+# 监听表中每个端口的标志位
+TCP4 = 0x01
+TCP6 = 0x02
+UDP4 = 0x04
+UDP6 = 0x08
+
+PROC_NET_FILES = (
+    ("/proc/net/tcp", False),
+    ("/proc/net/tcp6", False),
+    ("/proc/net/udp", True),
+    ("/proc/net/udp6", True),
+)
+
+WSL_RUNNING_CMD = "wsl -l --running -q"
+WSL_CMD = 'wsl -d "{distro}" -e cat /proc/net/tcp /proc/net/tcp6 /proc/net/udp /proc/net/udp6'
+
+TCP_LISTEN = "0A"
+UDP_UNCONNECTED = "07"
+
+
+def parse_proc_net(lines, table=None, udp=None):
+    """
+    流式解析 /proc/net/{tcp,tcp6,udp,udp6} 的行，写入 65536 字节的监听表
+
+    内核输出为定宽格式，按行首序号冒号后的固定偏移切片取端口和状态，不使用正则。
+    udp 为 None 时根据表头自动识别（udp 表头含 "ref pointer drops"），
+    因此多个文件直接拼接后的输出也能一次解析完成。
+    """
+    if table is None:
+        table = bytearray(65536)
+    is_udp = bool(udp)
+
+    for line in lines:
+        i = line.find(':')
+        if i < 0:
+            # 表头行不含冒号
+            if udp is None and "local_address" in line:
+                is_udp = "ref" in line
+            continue
+        try:
+            if line[i + 10] == ':':
+                # IPv4: XXXXXXXX:PPPP XXXXXXXX:PPPP ST
+                port = int(line[i + 11:i + 15], 16)
+                state = line[i + 30:i + 32]
+                flag = UDP4 if is_udp else TCP4
+            else:
+                # IPv6: 32 位十六进制地址
+                port = int(line[i + 35:i + 39], 16)
+                state = line[i + 78:i + 80]
+                flag = UDP6 if is_udp else TCP6
+        except (IndexError, ValueError):
+            # 非表格行（如 wsl 的错误提示）
+            continue
+
+        if port and state == (UDP_UNCONNECTED if is_udp else TCP_LISTEN):
+            table[port] |= flag
+
+    return table
+
+
+def collect_local_listeners():
+    """在 Linux（WSL 发行版内）直接读取 /proc/net，返回 (监听表, 错误)"""
+    table = bytearray(65536)
+    errors = []
+    for path, udp in PROC_NET_FILES:
+        try:
+            with open(path, 'r', buffering=1 << 16) as f:
+                parse_proc_net(f, table, udp)
+        except OSError as e:
+            errors.append(str(e))
+    return table, ("; ".join(errors) if errors else None)
+
+
+def get_running_distros():
+    """返回正在运行的 WSL 发行版名称，未安装或没有运行时返回空列表"""
+    stdout, stderr, code = run_cmd(WSL_RUNNING_CMD)
+    if code != 0:
+        return []
+    # wsl.exe 输出 UTF-16LE，按代码页解码后去掉夹杂的空字符
+    return [line.strip() for line in stdout.replace("\x00", "").splitlines() if line.strip()]
+
+
+def collect_wsl_listeners():
+    """
+    采集 WSL 发行版内的监听端口，返回 (监听表, 错误)
+
+    只读取已在运行的发行版；没有发行版运行时直接返回空表，
+    避免为了读取端口而启动 WSL 虚拟机，进而让 winnat 新增端口预留
+    """
+    if sys.platform.startswith("linux") and os.path.exists("/proc/net/tcp"):
+        return collect_local_listeners()
+
+    distros = get_running_distros()
+    if not distros:
+        return bytearray(65536), None
+    stdout, stderr, code = run_cmd(WSL_CMD.format(distro=distros[0]))
+    if code != 0 and not stdout:
+        return bytearray(65536), stderr or "无法读取 WSL 监听端口"
+    return parse_proc_net(stdout.splitlines()), None
+
+
+def listener_ports(table):
+    """返回监听表中有监听的端口（升序）"""
+    return list(compress(range(65536), table))
+
+
+def describe_flags(flags):
+    """把标志位转换为 'tcp/tcp6/udp' 形式"""
+    names = []
+    if flags & TCP4:
+        names.append("tcp")
+    if flags & TCP6:
+        names.append("tcp6")
+    if flags & UDP4:
+        names.append("udp")
+    if flags & UDP6:
+        names.append("udp6")
+    return "/".join(names)
+
+
+def merge_with_exclusions(ports, table):
+    """为每个端口排除范围附加落在其中的 WSL 监听端口 'wsl_listeners'"""
+    listeners = listener_ports(table)
+    merged = []
+    for item in ports:
+        lo = bisect_left(listeners, item['start'])
+        hi = bisect_right(listeners, item['end'])
+        merged.append(dict(item, wsl_listeners=listeners[lo:hi]))
+    return merged
+
+
+def _benchmark(sockets=100000):
+    """生成含 sockets 行的合成表并计时解析"""
+    import random
+    import time
+
+    rnd = random.Random(0)
+    tcp_header = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode"
+    udp_header = tcp_header + " ref pointer drops"
+    lines = [tcp_header]
+    for n in range(sockets):
+        state = "0A" if n % 10 == 0 else "01"
+        lines.append(f"{n:4d}: 0100007F:{rnd.randint(1, 65535):04X} 00000000:0000 {state} "
+                     f"00000000:00000000 00:00000000 00000000  1000        0 {n} 1 0000000000000000 100 0 0 10 0")
+    lines.append(udp_header)
+    for n in range(sockets // 10):
+        lines.append(f"{n:5d}: 00000000000000000000000000000000:{rnd.randint(1, 65535):04X} "
+                     f"00000000000000000000000000000000:0000 07 00000000:00000000 00:00000000 00000000  "
+                     f"1000        0 {n} 2 0000000000000000 0")
+
+    start = time.perf_counter()
+    table = parse_proc_net(lines)
+    elapsed = time.perf_counter() - start
+    print(f"{len(lines)} 行，解析耗时 {elapsed * 1000:.1f} ms，监听端口 {len(listener_ports(table))} 个")
+
+
+if __name__ == "__main__":
+    _benchmark()